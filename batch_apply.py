@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import (
+    QComboBox, QDialog, QHBoxLayout, QLabel, QListWidget, QListWidgetItem,
+    QProgressBar, QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout
+)
+from qgis.PyQt import sip
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
+from .field_index import FieldIndex
+from .scope import scope_for
+from .sql_translate import and_subset
+from .tasks import CountTask, SelectTask
+
+MODE_SELECT = "Objekte markieren"
+MODE_SUBSET = "Subset (Datenbank)"
+
+
+class BatchApplyDialog(QDialog):
+    """
+    Wendet den Filter des QueryBuilder-Dialogs auf mehrere Layer an.
+    Der Ausdruck wird einmal erzeugt; je Layer werden die Felder geprüft
+    und Auswahl bzw. Trefferzählung laufen parallel als QgsTasks.
+    """
+    COLUMNS = ("Layer", "Status", "Treffer")
+
+    def __init__(self, builder):
+        super().__init__(builder)
+        self.builder = builder
+        self.tasks = {}     # Layer-ID -> (laufender Task, Tabellenzeile)
+        self.progress = {}  # Layer-ID -> Fortschritt 0..100
+        self.setWindowTitle("QueryBuilder – Filter auf mehrere Layer")
+        self.resize(560, 480)
+        vbox = QVBoxLayout(self)
+
+        vbox.addWidget(QLabel("Layer:"))
+        self.layer_list = QListWidget()
+        for lyr in QgsProject.instance().mapLayers().values():
+            if isinstance(lyr, QgsVectorLayer):
+                item = QListWidgetItem(lyr.name())
+                item.setData(Qt.UserRole, lyr.id())
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked if lyr.id() == builder.layer.id() else Qt.Unchecked)
+                self.layer_list.addItem(item)
+        vbox.addWidget(self.layer_list)
+
+        hl = QHBoxLayout()
+        self.mode = QComboBox(); self.mode.addItems([MODE_SELECT, MODE_SUBSET])
+        hl.addWidget(QLabel("Anwenden als:")); hl.addWidget(self.mode); hl.addStretch()
+        vbox.addLayout(hl)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        vbox.addWidget(self.table)
+        self.bar = QProgressBar(); self.bar.setRange(0, 100)
+        vbox.addWidget(self.bar)
+
+        hl2 = QHBoxLayout()
+        self.btn_start = QPushButton("Anwenden")
+        self.btn_cancel = QPushButton("Abbrechen"); self.btn_cancel.setEnabled(False)
+        hl2.addStretch(); hl2.addWidget(self.btn_start); hl2.addWidget(self.btn_cancel)
+        vbox.addLayout(hl2)
+        self.btn_start.clicked.connect(self.start)
+        self.btn_cancel.clicked.connect(self.cancel)
+
+
+    def checked_layers(self):
+        project = QgsProject.instance()
+        for i in range(self.layer_list.count()):
+            item = self.layer_list.item(i)
+            lyr = project.mapLayer(item.data(Qt.UserRole))
+            if item.checkState() == Qt.Checked and lyr is not None:
+                yield lyr
+
+
+    def incompatible(self, layer, kinds):
+        """
+        Liste der Feldprobleme (fehlend / anderer Typ) für `layer`.
+        """
+        index = FieldIndex.for_layer(layer)
+        problems = []
+        for name, kind in kinds.items():
+            other = index.kind(name)
+            if other is None:
+                problems.append(f"{name} fehlt")
+            elif kind is not None and other != kind:
+                problems.append(f"{name}: Typ {other} statt {kind}")
+        return problems
+
+
+    def start(self):
+        self.cancel()
+        b = self.builder
+        model = b.build_model()
+        expr = b.compile_model(model)
+        if not expr or expr.replace("(", "").replace(")", "").strip() == "":
+            return
+        kinds = {c.field: c.kind for g in model.groups for c in g.conditions if c.field}
+        subset = self.mode.currentText() == MODE_SUBSET
+        scope_mode = model.scope
+
+        self.table.setRowCount(0)
+        self.progress = {}
+        for layer in self.checked_layers():
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self._set_row(row, layer.name(), "", "")
+            problems = self.incompatible(layer, kinds)
+            if problems:
+                self._set_row(row, status="übersprungen: " + ", ".join(problems))
+                continue
+            # Bereich (Kartenausschnitt / Auswahl) je Layer in dessen KBS
+            scope = scope_for(scope_mode, layer, b.canvas)
+            if subset:
+                task = self._subset_task(layer, model, expr, row, scope)
+            else:
+                task = SelectTask(layer, expr, scope)
+                self._watch(task, layer, row)
+            QgsApplication.taskManager().addTask(task)
+        self._update_progress()
+
+
+    def _subset_task(self, layer, model, expr, row, scope):
+        """
+        Exakt übersetzbar: zählen per Provider, Subset danach setzen.
+        Sonst Subset als Obermenge setzen und per Auswahl nachfiltern,
+        ohne SQL-Dialekt nur auswählen (wie apply_subset).
+        """
+        translated = self.builder.provider_sql(layer, model)
+        if translated is not None and translated[1] and scope is None:
+            task = CountTask(layer, expr, translated[0])
+            self._watch(task, layer, row, sql=translated[0])
+            return task
+        failed = translated is not None and not self._set_subset(layer, translated[0])
+        task = SelectTask(layer, expr, scope)
+        self._watch(task, layer, row)
+        if failed:
+            self._set_row(row, status="Subset nicht möglich, läuft als Auswahl…")
+        return task
+
+
+    def _set_subset(self, layer, sql):
+        backup = self.builder.subset_backup
+        prev = backup.get(layer.id(), layer.subsetString())
+        if not layer.setSubsetString(and_subset(prev, sql)):
+            return False
+        backup.setdefault(layer.id(), prev)
+        return True
+
+
+    def _watch(self, task, layer, row, sql=None):
+        lid = layer.id()
+        self.tasks[lid] = (task, row)
+        self.progress[lid] = 0
+        self._set_row(row, status="läuft…")
+
+        def on_progress(p):
+            if self.tasks.get(lid, (None,))[0] is task:
+                self.progress[lid] = p
+                self._update_progress()
+
+        def on_done():
+            if self.tasks.get(lid, (None,))[0] is not task or sip.isdeleted(self):
+                return
+            del self.tasks[lid]
+            self.progress[lid] = 100
+            if isinstance(task, SelectTask):
+                layer.selectByIds(task.ids)
+                count = len(task.ids)
+            else:
+                layer.removeSelection()
+                count = task.count
+                if not self._set_subset(layer, sql):
+                    self._set_row(row, status="Subset nicht möglich", count=count)
+                    self._update_progress()
+                    return
+            self._set_row(row, status="fertig", count=f"{count:,}".replace(",", "."))
+            self._update_progress()
+
+        def on_failed():
+            if self.tasks.get(lid, (None,))[0] is not task or sip.isdeleted(self):
+                return
+            del self.tasks[lid]
+            self.progress[lid] = 100
+            self._set_row(row, status="abgebrochen" if task.error is None else f"Fehler: {task.error}")
+            self._update_progress()
+
+        task.progressChanged.connect(on_progress)
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+
+
+    def _set_row(self, row, name=None, status=None, count=None):
+        for col, val in enumerate((name, status, count)):
+            if val is not None:
+                self.table.setItem(row, col, QTableWidgetItem(str(val)))
+        self.table.resizeColumnsToContents()
+
+
+    def _update_progress(self):
+        # Gesamtfortschritt = Mittel über alle gestarteten Layer
+        self.bar.setValue(int(sum(self.progress.values()) / len(self.progress))
+                          if self.progress else 0)
+        self.btn_cancel.setEnabled(bool(self.tasks))
+        b = self.builder
+        b.btn_restore.setEnabled(b.layer.id() in b.subset_backup)
+
+
+    def cancel(self):
+        tasks, self.tasks = self.tasks, {}
+        for task, row in tasks.values():
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
+            self._set_row(row, status="abgebrochen")
+        self.btn_cancel.setEnabled(False)
+
+
+    def closeEvent(self, event):
+        self.cancel()
+        super().closeEvent(event)
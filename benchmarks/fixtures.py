@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetische Test-Layer für die Benchmarks (Memory oder GeoPackage).
+"""
+import os
+import random
+
+from qgis.PyQt.QtCore import QDate, QVariant
+from qgis.core import (
+    QgsCoordinateTransformContext, QgsEditorWidgetSetup, QgsFeature, QgsField,
+    QgsGeometry, QgsPointXY, QgsProject, QgsVectorFileWriter, QgsVectorLayer
+)
+
+LOW_CARD = [f"Baumart {i}" for i in range(20)]
+TAGS = ["a", "b", "c", "d", "e", "f"]
+CATEGORIES = {str(i): f"Kategorie {i}" for i in range(1, 11)}
+LOOKUP_SIZE = 500
+BATCH = 50000
+
+
+def lookup_layer(fmt="memory", directory=None):
+    """
+    Bezugslayer für das ValueRelation-Feld.
+    """
+    lyr = QgsVectorLayer("None", "bench_lookup", "memory")
+    prov = lyr.dataProvider()
+    prov.addAttributes([QgsField("id", QVariant.Int), QgsField("name", QVariant.String)])
+    lyr.updateFields()
+    feats = []
+    for i in range(LOOKUP_SIZE):
+        f = QgsFeature(lyr.fields())
+        f.setAttributes([i, f"Eintrag {i}"])
+        feats.append(f)
+    prov.addFeatures(feats)
+    if fmt == "gpkg":
+        lyr = _to_gpkg(lyr, directory, "bench_lookup")
+    QgsProject.instance().addMapLayer(lyr)
+    return lyr
+
+
+def bench_layer(n, lookup, fmt="memory", directory=None, seed=42):
+    """
+    Punkt-Layer mit `n` Objekten und Feldern niedriger/hoher Kardinalität,
+    Datum, ValueMap, ValueRelation und Mehrfachwerten "{a,b}".
+    """
+    rnd = random.Random(seed)
+    lyr = QgsVectorLayer("Point?crs=EPSG:25832", f"bench_{n}", "memory")
+    prov = lyr.dataProvider()
+    prov.addAttributes([
+        QgsField("fid_nr", QVariant.Int),
+        QgsField("baumart", QVariant.String),
+        QgsField("flurstueck", QVariant.String),
+        QgsField("datum", QVariant.Date),
+        QgsField("kategorie", QVariant.String),
+        QgsField("eintrag", QVariant.Int),
+        QgsField("merkmale", QVariant.String),
+        QgsField("hoehe", QVariant.Double),
+    ])
+    lyr.updateFields()
+    start = QDate(2000, 1, 1)
+    feats = []
+    for i in range(n):
+        f = QgsFeature(lyr.fields())
+        f.setGeometry(QgsGeometry.fromPointXY(
+            QgsPointXY(rnd.uniform(280000, 920000), rnd.uniform(5200000, 6100000))
+        ))
+        tags = rnd.sample(TAGS, rnd.randint(0, 3))
+        f.setAttributes([
+            i,
+            rnd.choice(LOW_CARD),
+            f"{rnd.randint(1, 999):03d}-{i:07d}",
+            start.addDays(rnd.randint(0, 9000)),
+            rnd.choice(list(CATEGORIES)),
+            rnd.randrange(LOOKUP_SIZE),
+            "{" + ",".join(tags) + "}" if tags else None,
+            round(rnd.uniform(1, 40), 1),
+        ])
+        feats.append(f)
+        if len(feats) >= BATCH:
+            prov.addFeatures(feats); feats = []
+    if feats:
+        prov.addFeatures(feats)
+    if fmt == "gpkg":
+        lyr = _to_gpkg(lyr, directory, f"bench_{n}")
+
+    fields = lyr.fields()
+    lyr.setEditorWidgetSetup(fields.indexOf("kategorie"), QgsEditorWidgetSetup(
+        "ValueMap", {"map": CATEGORIES}
+    ))
+    lyr.setEditorWidgetSetup(fields.indexOf("eintrag"), QgsEditorWidgetSetup(
+        "ValueRelation", {"Layer": lookup.id(), "Key": "id", "Value": "name",
+                          "FilterExpression": ""}
+    ))
+    QgsProject.instance().addMapLayer(lyr)
+    return lyr
+
+
+def _to_gpkg(lyr, directory, name):
+    path = os.path.join(directory, f"{name}.gpkg")
+    opts = QgsVectorFileWriter.SaveVectorOptions()
+    opts.driverName = "GPKG"
+    opts.layerName = name
+    err = QgsVectorFileWriter.writeAsVectorFormatV3(
+        lyr, path, QgsCoordinateTransformContext(), opts
+    )
+    if err[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f"GeoPackage konnte nicht geschrieben werden: {err}")
+    out = QgsVectorLayer(f"{path}|layername={name}", name, "ogr")
+    if not out.isValid():
+        raise RuntimeError(f"GeoPackage ungültig: {path}")
+    return out
+
+
+def large_filter(groups=50, per_group=4):
+    """
+    Filter-JSON mit vielen Gruppen und Bedingungen (wie von save_filter).
+    """
+    rnd = random.Random(7)
+    ops = ["=", "!=", "enthält", "zwischen", ">=", "ist nicht leer"]
+    data = {"version": "v0.4.3", "groups": []}
+    for g in range(groups):
+        blocks = []
+        for _ in range(per_group):
+            op = rnd.choice(ops)
+            if op == "zwischen":
+                blocks.append({"field": "datum", "operator": op,
+                               "value1": "2005-01-01", "value2": "2010-12-31"})
+            elif op == ">=":
+                blocks.append({"field": "hoehe", "operator": op,
+                               "value1": str(rnd.randint(5, 30)), "value2": ""})
+            else:
+                blocks.append({"field": "baumart", "operator": op,
+                               "value1": rnd.choice(LOW_CARD), "value2": ""})
+        data["groups"].append({"op": "UND" if g == 0 else rnd.choice(["UND", "ODER"]),
+                               "blocks": blocks})
+    return data
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark-Suite für den QueryBuilder, läuft ohne Bildschirm
+(QT_QPA_PLATFORM=offscreen, eigenständige QgsApplication).
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 \\
+        --format gpkg --output bench.json --baseline baseline.json
+
+Die Ergebnisse (Median-Sekunden je Messpunkt und Layergröße) werden als
+JSON geschrieben; mit --baseline wird gegen einen früheren Lauf verglichen
+und bei Verschlechterung über --tolerance mit Exit-Code 1 beendet.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qgis.core import Qgis, QgsApplication, QgsProject  # noqa: E402
+
+import fixtures  # noqa: E402
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("Alle eindeutigen Werte", "10 Stichproben", "Nur verwendete Werte")
+VALUE_FIELDS = ("baumart", "flurstueck", "merkmale", "eintrag")
+APPLY_FILTER = {"version": "v0.4.3", "groups": [{"op": "UND", "blocks": [
+    {"field": "baumart", "operator": "=", "value1": "Baumart 3", "value2": ""},
+    {"field": "hoehe", "operator": ">=", "value1": "20", "value2": ""},
+]}]}
+
+
+def load_plugin():
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    pkg = os.path.basename(PLUGIN_DIR)
+    return {name: importlib.import_module(f"{pkg}.{name}") for name in (
+        "querybuilder_dialog", "value_cache", "value_source", "tasks", "filter_model",
+        "optimizer"
+    )}
+
+
+def timed(fn, repeat):
+    """
+    Median der Laufzeit von `fn` in Sekunden über `repeat` Läufe.
+    """
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+        QgsApplication.processEvents()
+    return statistics.median(runs)
+
+
+def bench_layer(mods, layer, repeat, fmt):
+    dlg_mod, cache_mod = mods["querybuilder_dialog"], mods["value_cache"]
+    opt = mods["optimizer"]
+    fm, vs, tasks = mods["filter_model"], mods["value_source"], mods["tasks"]
+    Dialog, ValueCache = dlg_mod.QueryBuilderDialog, cache_mod.ValueCache
+    res = {}
+
+    res["dialog_init"] = timed(lambda: Dialog(layer, ValueCache()), repeat)
+    dlg = Dialog(layer, ValueCache())
+    grp = dlg.groups[0]
+
+    res["add_condition"] = timed(lambda: dlg.add_condition(grp), repeat)
+
+    blk = grp["blocks"][0]
+    fields = [blk["fld"].itemData(i) for i in range(blk["fld"].count())]
+
+    def switch_fields():
+        for i in range(len(fields)):
+            blk["fld"].setCurrentIndex(i)
+    res["field_switch_all"] = timed(switch_fields, repeat)
+
+    for name in VALUE_FIELDS:
+        def cold(name=name):
+            dlg.cache.clear()
+            dlg.distinct_values(name)
+        res[f"distinct_cold[{name}]"] = timed(cold, repeat)
+        res[f"distinct_warm[{name}]"] = timed(lambda name=name: dlg.distinct_values(name), repeat)
+        res[f"value_task[{name}]"] = timed(
+            lambda name=name: tasks.ValueLoadTask(layer, name).run(), repeat
+        )
+        res[f"sample[{name}]"] = timed(
+            lambda name=name: vs.sample_values(layer, name, 10), repeat
+        )
+
+    res["prepare_layer"] = timed(
+        lambda: tasks.PrepareLayerTask(layer, fields).run(), repeat
+    )
+
+    blk["fld"].setCurrentIndex(blk["fld"].findData("merkmale"))
+    for mode in MODES:
+        def popup(mode=mode):
+            dlg.cache.clear()
+            dlg.load_field_values(mode, "merkmale", blk["in1"])
+            blk["in1"].completer().popup().hide()
+        res[f"load_field_values[{mode}]"] = timed(popup, repeat)
+
+    big = fixtures.large_filter()
+    model = fm.FilterModel.from_dict(big)
+    res["compile_headless_cold"] = timed(lambda: fm.FilterCompiler().compile(model), repeat)
+    warm = fm.FilterCompiler(); warm.compile(model)
+    res["compile_headless_warm"] = timed(lambda: warm.compile(model), repeat)
+    res["optimize_headless"] = timed(lambda: opt.optimize(model), repeat)
+
+    res["load_filter_large"] = timed(
+        lambda: dlg.set_model(fm.FilterModel.from_dict(big)), repeat
+    )
+
+    def generate():
+        dlg.compiler = fm.FilterCompiler()
+        dlg.optimizer = opt.Optimizer()
+        dlg.generate_expression()
+    res["generate_expression_large"] = timed(generate, repeat)
+
+    dlg.set_model(fm.FilterModel.from_dict(APPLY_FILTER))
+    dlg.generate_expression()
+    expr = dlg.preview.toPlainText()
+    res["apply_filter"] = timed(dlg.apply_filter, repeat)
+    res["count_task"] = timed(lambda: tasks.CountTask(layer, expr).run(), repeat)
+    if fmt == "gpkg":
+        def subset():
+            dlg.apply_subset()
+            dlg.restore_subset()
+        res["apply_subset"] = timed(subset, repeat)
+
+    dlg.cancel_count_task()
+    dlg.deleteLater()
+    return res
+
+
+def compare(results, baseline, tolerance):
+    worse = []
+    for size, metrics in results["results"].items():
+        base = baseline.get("results", {}).get(size, {})
+        for name, secs in sorted(metrics.items()):
+            if name not in base or base[name] <= 0:
+                continue
+            ratio = secs / base[name]
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  <-- langsamer"
+                worse.append((size, name, ratio))
+            print(f"{size:>8} {name:<45} {base[name]:10.4f} {secs:10.4f} {ratio:6.2f}x{flag}")
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--format", choices=("memory", "gpkg"), default="memory")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--output", default="bench_output.json")
+    ap.add_argument("--baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args()
+
+    app = QgsApplication([], True)
+    app.initQgis()
+    mods = load_plugin()
+    results = {
+        "meta": {
+            "qgis": Qgis.QGIS_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "format": args.format,
+            "repeat": args.repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        lookup = fixtures.lookup_layer(args.format, tmp)
+        for n in (int(x) for x in args.sizes.split(",")):
+            t0 = time.perf_counter()
+            layer = fixtures.bench_layer(n, lookup, args.format, tmp)
+            print(f"Layer mit {n} Objekten erzeugt ({time.perf_counter() - t0:.1f}s)")
+            results["results"][str(n)] = bench_layer(mods, layer, args.repeat, args.format)
+            QgsProject.instance().removeMapLayer(layer.id())
+        QgsProject.instance().clear()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Ergebnisse geschrieben: {args.output}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        status = 1 if worse else 0
+    app.exitQgis()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
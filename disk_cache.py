@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Persistenter Werte-Cache (SQLite im QGIS-Profil). Schlüssel sind
+Datenquelle ohne Passwort, Subset-String und Cache-Schlüssel; ein Eintrag
+gilt nur, solange Objektanzahl, Dateizeitstempel (falls vorhanden) und
+Höchstalter passen.
+"""
+import os
+import pickle
+import sqlite3
+import time
+
+from qgis.core import (
+    QgsApplication, QgsDataSourceUri, QgsProviderRegistry, QgsSettings
+)
+
+SETTINGS_ENABLED = "QueryBuilder/diskCache"
+SETTINGS_TTL = "QueryBuilder/diskCacheTtlHours"
+SCHEMA_VERSION = 1
+# Provider ohne dauerhafte Datenquelle
+VOLATILE_PROVIDERS = {"memory", "virtual"}
+
+
+class DiskCache:
+
+    @classmethod
+    def from_settings(cls):
+        """
+        DiskCache gemäß QGIS-Einstellungen oder None, wenn abgeschaltet.
+        """
+        s = QgsSettings()
+        if not s.value(SETTINGS_ENABLED, True, type=bool):
+            return None
+        path = os.path.join(QgsApplication.qgisSettingsDirPath(), "querybuilder_cache.sqlite")
+        return cls(path, ttl=s.value(SETTINGS_TTL, 168, type=int) * 3600)
+
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS entries")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " source TEXT, subset TEXT, key TEXT,"
+            " feature_count INTEGER, modified REAL, created REAL,"
+            " fields TEXT, data BLOB,"
+            " PRIMARY KEY (source, subset, key))"
+        )
+        conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        conn.commit()
+        return conn
+
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+    def source_key(self, layer):
+        """
+        Provider + Datenquelle ohne Passwort, None für flüchtige Layer.
+        """
+        prov = layer.providerType()
+        if prov in VOLATILE_PROVIDERS:
+            return None
+        return f"{prov}:{QgsDataSourceUri.removePassword(layer.source())}"
+
+
+    def _modified(self, layer):
+        path = QgsProviderRegistry.instance().decodeUri(
+            layer.providerType(), layer.source()
+        ).get("path")
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+
+
+    def _usable(self, layer):
+        # Ungespeicherte Änderungen stehen nicht in der Datenquelle
+        return not layer.isModified() and self.source_key(layer) is not None
+
+
+    def snapshot(self, layer):
+        """
+        (Quelle, Subset, Objektanzahl, Zeitstempel) des Layers oder None,
+        wenn er nicht gecacht wird. Im Hauptthread ermitteln; damit können
+        read()/write() auch in einem QgsTask laufen.
+        """
+        if not self._usable(layer):
+            return None
+        return (self.source_key(layer), layer.subsetString(),
+                layer.featureCount(), self._modified(layer))
+
+
+    def _row(self, conn, snap, key, columns):
+        row = conn.execute(
+            f"SELECT feature_count, modified, created, {columns} FROM entries"
+            " WHERE source = ? AND subset = ? AND key = ?",
+            (snap[0], snap[1], repr(key))
+        ).fetchone()
+        if row is None:
+            return None
+        count, modified, created = row[:3]
+        if time.time() - created > self.ttl or count != snap[2] or modified != snap[3]:
+            return False
+        return row[3:]
+
+
+    def _load(self, conn, snap, key):
+        row = self._row(conn, snap, key, "fields, data")
+        if not row:
+            return row
+        fields, data = row
+        try:
+            return pickle.loads(data), set(fields.split("\n")) if fields else set()
+        except Exception:
+            # z. B. Format einer älteren Plugin-Version
+            return False
+
+
+    def _store(self, conn, snap, key, values, fields):
+        data = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (snap[0], snap[1], repr(key), snap[2], snap[3], time.time(),
+             "\n".join(sorted(fields)), data)
+        )
+        conn.commit()
+
+
+    def get(self, layer, key):
+        """
+        (Werte, Felder) oder None, wenn kein frischer Eintrag existiert.
+        """
+        snap = self.snapshot(layer)
+        if snap is None:
+            return None
+        try:
+            stored = self._load(self._db(), snap, key)
+        except sqlite3.Error:
+            return None
+        if stored is False:
+            self.delete(layer, key)
+            return None
+        return stored
+
+
+    def contains(self, layer, key):
+        """
+        True, wenn ein frischer Eintrag existiert (ohne ihn zu laden).
+        """
+        snap = self.snapshot(layer)
+        if snap is None:
+            return False
+        try:
+            return bool(self._row(self._db(), snap, key, "length(data)"))
+        except sqlite3.Error:
+            return False
+
+
+    def put(self, layer, key, values, fields):
+        snap = self.snapshot(layer)
+        if snap is None:
+            return
+        try:
+            self._store(self._db(), snap, key, values, fields)
+        except (sqlite3.Error, pickle.PicklingError, TypeError):
+            pass
+
+
+    def read(self, snap, key):
+        """
+        Wie get() zu einem snapshot(), mit eigener Verbindung (für Tasks).
+        """
+        try:
+            conn = self._connect()
+            try:
+                return self._load(conn, snap, key) or None
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+
+
+    def write(self, snap, key, values, fields):
+        """
+        Wie put() zu einem snapshot(), mit eigener Verbindung (für Tasks).
+        """
+        try:
+            conn = self._connect()
+            try:
+                self._store(conn, snap, key, values, fields)
+            finally:
+                conn.close()
+        except (sqlite3.Error, pickle.PicklingError, TypeError):
+            pass
+
+
+    def delete(self, layer, key):
+        try:
+            self._db().execute(
+                "DELETE FROM entries WHERE source = ? AND subset = ? AND key = ?",
+                (self.source_key(layer), layer.subsetString(), repr(key))
+            )
+            self._conn.commit()
+        except sqlite3.Error:
+            pass
+
+
+    def invalidate(self, layer):
+        """
+        Verwirft alle Einträge der Datenquelle (alle Subsets).
+        """
+        source = self.source_key(layer)
+        if source is None:
+            return
+        try:
+            self._db().execute("DELETE FROM entries WHERE source = ?", (source,))
+            self._conn.commit()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import QModelIndex
+from qgis.core import QgsFields
+from .widgets import FieldListModel
+from .filter_model import KIND_TEXT, KIND_NUMBER, KIND_DATE
+
+
+class FieldInfo:
+    __slots__ = ("name", "index", "type_name", "is_date", "is_numeric",
+                 "alias", "label", "editor_type", "editor_config", "provider_index")
+
+
+class FieldIndex:
+    """
+    Feld-Metadaten eines Layers (Name → Index, Typ, Datumsflag, Alias,
+    Editor-Setup), einmal aufgebaut und bei `updatedFields` erneuert.
+    Das zugehörige FieldListModel teilen sich alle Feld-Auswahlen.
+    """
+    _registry = {}  # layer_id -> FieldIndex
+
+    @classmethod
+    def for_layer(cls, layer):
+        idx = cls._registry.get(layer.id())
+        if idx is None:
+            idx = cls._registry[layer.id()] = cls(layer)
+        return idx
+
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.fields = []
+        self._by_name = {}
+        self.model = FieldListModel(self)
+        self.rebuild()
+        layer.updatedFields.connect(self.rebuild)
+        layer.willBeDeleted.connect(lambda lid=layer.id(): self._registry.pop(lid, None))
+
+
+    def rebuild(self):
+        fields = self.layer.fields()
+        infos = []
+        for i, f in enumerate(fields):
+            info = FieldInfo()
+            info.name = f.name()
+            info.index = i
+            info.type_name = f.typeName()
+            info.is_date = "date" in f.typeName().lower()
+            info.is_numeric = f.isNumeric()
+            info.alias = self.layer.attributeAlias(i) or f.name().replace("_", " ").title()
+            info.label = f"{info.alias} ({info.name})"
+            setup = self.layer.editorWidgetSetup(i)
+            info.editor_type = setup.type()
+            info.editor_config = setup.config()
+            info.provider_index = (
+                fields.fieldOriginIndex(i)
+                if fields.fieldOrigin(i) == QgsFields.OriginProvider else -1
+            )
+            infos.append(info)
+        # Layout-Änderung statt Reset: die Auswahl der Feld-Comboboxen
+        # hängt an persistenten Indizes und folgt so dem Feldnamen
+        model = self.model
+        model.layoutAboutToBeChanged.emit()
+        old = model.persistentIndexList()
+        names = [self.fields[i.row()].name if i.row() < len(self.fields) else None
+                 for i in old]
+        self.fields = infos
+        self._by_name = {info.name: info for info in infos}
+        model.changePersistentIndexList(old, [
+            model.index(self._by_name[n].index) if n in self._by_name else QModelIndex()
+            for n in names
+        ])
+        model.layoutChanged.emit()
+
+
+    def info(self, name):
+        return self._by_name.get(name)
+
+
+    def kind(self, name):
+        """
+        KIND_DATE / KIND_NUMBER / KIND_TEXT des Feldes, None wenn unbekannt.
+        """
+        info = self._by_name.get(name)
+        if info is None:
+            return None
+        if info.is_date:
+            return KIND_DATE
+        return KIND_NUMBER if info.is_numeric else KIND_TEXT
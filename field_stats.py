@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import sys
+from collections import Counter
+
+from .value_source import hashable_value, split_multi_value
+
+# Höchstzahl gezählter Werte über alle Felder eines Scans
+MAX_TOTAL_DISTINCT = 500000
+# Cache-Schlüssel der Statistik eines Layers (ein Eintrag für alle Felder)
+STATS_KEY = ("__stats__",)
+
+
+class FieldStats:
+    """
+    Statistik eines Feldes aus einem Scan: Häufigkeiten der Werte,
+    NULL-/Leer-Anzahl, Minimum/Maximum und aufgelöste Mehrfachwerte.
+    Ab `max_distinct` verschiedenen Werten oder wenn das gemeinsame
+    Kontingent `budget` (einelementige Liste, von allen Feldern eines Scans
+    geteilt) aufgebraucht ist, werden keine neuen Werte mehr gezählt
+    (truncated), Min/Max/NULLs bleiben exakt.
+    """
+    __slots__ = ("name", "counts", "parts", "nulls", "rows", "minimum",
+                 "maximum", "truncated", "max_distinct", "budget", "_text")
+
+    def __init__(self, name, max_distinct=50000, budget=None):
+        self.name = name
+        self.counts = Counter()
+        self.parts = None
+        self.nulls = 0
+        self.rows = 0
+        self.minimum = None
+        self.maximum = None
+        self.truncated = False
+        self.max_distinct = max_distinct
+        self.budget = budget
+        self._text = None
+
+
+    def add(self, val):
+        self.rows += 1
+        if val in (None, ''):
+            self.nulls += 1
+            return
+        val = hashable_value(val)
+        if val in self.counts:
+            self.counts[val] += 1
+        elif len(self.counts) < self.max_distinct and (self.budget is None or self.budget[0] > 0):
+            self.counts[val] = 1
+            if self.budget is not None:
+                self.budget[0] -= 1
+        else:
+            self.truncated = True
+        try:
+            if self.minimum is None or val < self.minimum:
+                self.minimum = val
+            if self.maximum is None or val > self.maximum:
+                self.maximum = val
+        except TypeError:
+            pass
+
+
+    def finish(self):
+        """
+        Löst Mehrfachwerte "{a,b}" in Einzelwerte mit Häufigkeiten auf.
+        """
+        parts = Counter()
+        multi = False
+        for val, n in self.counts.items():
+            if isinstance(val, (list, tuple)) or (
+                    isinstance(val, str) and val.startswith("{") and val.endswith("}")):
+                multi = True
+            for part in split_multi_value(val):
+                parts[part] += n
+        self.parts = parts if multi else self.counts
+        self.budget = None
+        return self
+
+
+    def distinct(self):
+        return set(self.counts)
+
+
+    def by_frequency(self, exploded=True):
+        """(Wert, Anzahl), häufigste zuerst."""
+        return (self.parts if exploded and self.parts is not None else self.counts).most_common()
+
+
+    def text_counts(self):
+        """
+        {Wert als Text: Anzahl} zum Abgleich mit Filterwerten (gemerkt).
+        """
+        tc = getattr(self, "_text", None)
+        if tc is None:
+            tc = {}
+            for val, n in self.counts.items():
+                if isinstance(val, float) and val.is_integer():
+                    key = str(int(val))
+                elif hasattr(val, "toString"):
+                    key = val.toString("yyyy-MM-dd")  # QDate / QDateTime
+                else:
+                    key = str(val)
+                tc[key] = tc.get(key, 0) + n
+            self._text = tc
+        return tc
+
+
+    def quantiles(self, qs):
+        """
+        {q: Wert} aus den gezählten Werten; exakt, solange nicht truncated.
+        """
+        try:
+            items = sorted(self.counts.items())
+        except TypeError:
+            return {}
+        total = sum(n for _, n in items)
+        targets = sorted(qs)
+        out, acc, i = {}, 0, 0
+        for val, n in items:
+            acc += n
+            while i < len(targets) and acc >= targets[i] * total:
+                out[targets[i]] = val
+                i += 1
+        return out
+
+
+    def estimate_size(self):
+        size = sys.getsizeof(self.counts) + sum(sys.getsizeof(v) for v in self.counts)
+        if self.parts is not None and self.parts is not self.counts:
+            size += sys.getsizeof(self.parts) + sum(sys.getsizeof(v) for v in self.parts)
+        return size
+
+
+class LayerStats(dict):
+    """
+    {Feldname: FieldStats} eines Scans; als ein einziger Cache-Eintrag
+    abgelegt, damit breite Layer nicht ihre eigene Statistik verdrängen.
+    """
+
+    def estimate_size(self):
+        return sys.getsizeof(self) + sum(st.estimate_size() for st in self.values())
+
+
+def scan_stats(features, fields, max_distinct=50000, is_canceled=None,
+               max_total=MAX_TOTAL_DISTINCT):
+    """
+    Ein Durchlauf über `features` für alle `fields` ((Name, Index)-Paare).
+    Höchstens `max_total` verschiedene Werte über alle Felder zusammen.
+    Liefert LayerStats bzw. None bei Abbruch.
+    """
+    budget = [max_total]
+    stats = [(FieldStats(name, max_distinct, budget), idx) for name, idx in fields]
+    for n, feat in enumerate(features):
+        if is_canceled is not None and n % 1000 == 0 and is_canceled():
+            return None
+        attrs = feat.attributes()
+        for st, idx in stats:
+            st.add(attrs[idx])
+    return LayerStats((st.name, st.finish()) for st, _ in stats)
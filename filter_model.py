@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Qt-freies Filtermodell (Gruppen, Bedingungen, Operatoren, typisierte Werte)
+und Compiler zu QGIS-Ausdrücken. Läuft ohne GUI und ohne QGIS, z. B. für
+Batch-Jobs über gespeicherte Filter-JSONs.
+"""
+import re
+from dataclasses import dataclass, field as dc_field
+from typing import List, Optional
+
+FORMAT_VERSION = "v0.4.3"
+
+OPERATORS = [
+    "=", "!=", ">", "<", ">=", "<=", "zwischen",
+    "enthält", "ist leer", "ist nicht leer", "ist in Liste"
+]
+LIST_OPERATOR = "ist in Liste"
+# Trenner eingefügter Listen: Zeilen, Tabs (Tabellenkalkulation) oder ";"
+LIST_SEPARATORS = re.compile(r"[\r\n\t;]+")
+
+# Werttypen einer Bedingung; None = wie bisher anhand des Wertes raten
+KIND_TEXT, KIND_NUMBER, KIND_DATE = "text", "number", "date"
+
+# Räumlicher Bereich des Filters (siehe scope.py)
+SCOPE_LAYER, SCOPE_EXTENT, SCOPE_SELECTION = "layer", "extent", "selection"
+
+
+@dataclass
+class Condition:
+    field: str
+    operator: str = "="
+    value1: str = ""
+    value2: str = ""
+    kind: Optional[str] = None
+    # key -> Anzeigewert (ValueMap / ValueRelation), wird nicht gespeichert
+    value_map: Optional[dict] = dc_field(default=None, repr=False, compare=False)
+
+    def resolved(self):
+        if self.operator == LIST_OPERATOR:
+            return "\n".join(resolve_list(self.value1, self.value_map, self.kind)), ""
+        return (resolve_value(self.value1, self.value_map),
+                resolve_value(self.value2, self.value_map))
+
+    def signature(self):
+        if self.operator == LIST_OPERATOR:
+            # Listen nicht bei jeder Vorschau auflösen
+            return (self.field, self.operator, self.kind, self.value1,
+                    len(self.value_map or ()))
+        return (self.field, self.operator, self.kind) + self.resolved()
+
+    def to_dict(self):
+        return {"field": self.field, "operator": self.operator,
+                "value1": self.value1, "value2": self.value2}
+
+    @classmethod
+    def from_dict(cls, bd):
+        return cls(bd.get("field", ""), bd.get("operator", "="),
+                   bd.get("value1", ""), bd.get("value2", ""))
+
+
+@dataclass
+class Group:
+    op: str = "UND"
+    conditions: List[Condition] = dc_field(default_factory=list)
+
+    def signature(self):
+        return tuple(c.signature() for c in self.conditions)
+
+    def to_dict(self):
+        return {"op": self.op, "blocks": [c.to_dict() for c in self.conditions]}
+
+    @classmethod
+    def from_dict(cls, gd):
+        return cls(gd.get("op", "UND"),
+                   [Condition.from_dict(bd) for bd in gd.get("blocks", [])])
+
+
+@dataclass
+class FilterModel:
+    groups: List[Group] = dc_field(default_factory=list)
+    version: str = FORMAT_VERSION
+    scope: str = SCOPE_LAYER
+
+    def to_dict(self):
+        return {"version": self.version, "scope": self.scope,
+                "groups": [g.to_dict() for g in self.groups]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([Group.from_dict(gd) for gd in data.get("groups", [])],
+                   data.get("version", FORMAT_VERSION),
+                   data.get("scope", SCOPE_LAYER))
+
+
+def needs_value_map(raw):
+    """
+    True, wenn `raw` nur über die Anzeigewert-Zuordnung auflösbar ist
+    (Mehrfachwert "{…}" oder reiner Anzeigewert ohne "(key)").
+    """
+    if not raw:
+        return False
+    if raw.startswith("{") and raw.endswith("}"):
+        return True
+    return re.match(r'^(.*)\s*\((.*)\)$', raw) is None
+
+
+def resolve_value(raw, value_map=None):
+    """
+    Anzeigewert → gespeicherter Schlüssel. "Anzeige (key)" liefert key,
+    Mehrfachwerte "{"A","B"}" werden elementweise aufgelöst.
+    """
+    value_map = value_map or {}
+    if raw.startswith("{") and raw.endswith("}"):
+        items = re.findall(r'"([^"]+)"', raw)
+        rev = {v: k for k, v in value_map.items()}
+        keys = [str(rev.get(d, d)) for d in items]
+        return '{' + ','.join(keys) + '}'
+    m = re.match(r'^(.*)\s*\((.*)\)$', raw)
+    if m:
+        return m.group(2)
+    if not raw:
+        return raw
+    rev = {v: k for k, v in value_map.items()}
+    return str(rev.get(raw, raw))
+
+
+def split_list(raw):
+    """
+    Einzelwerte einer eingefügten Liste, ohne Leerwerte und Duplikate
+    (Reihenfolge bleibt erhalten).
+    """
+    return list(dict.fromkeys(
+        v.strip() for v in LIST_SEPARATORS.split(raw or "") if v.strip()
+    ))
+
+
+def coerce_value(value, kind):
+    """
+    `value` passend zum Feldtyp (Dezimalkomma, TT.MM.JJJJ) oder None,
+    wenn er nicht passt.
+    """
+    if kind == KIND_NUMBER:
+        v = value.replace(" ", "")
+        if "," in v and "." not in v:
+            v = v.replace(",", ".")
+        return v if re.match(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$", v) else None
+    if kind == KIND_DATE:
+        m = re.match(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})$", value)
+        if m:
+            return f"{m.group(3)}-{int(m.group(2)):02d}-{int(m.group(1)):02d}"
+        return value if re.match(r"^\d{4}-\d{2}-\d{2}$", value) else None
+    return value
+
+
+def reverse_map(value_map):
+    """
+    Anzeigewert → Schlüssel (beides als Text) für resolve_item.
+    """
+    return {str(v): str(k) for k, v in (value_map or {}).items()}
+
+
+def resolve_item(item, rev, kind=None):
+    """
+    Schlüssel eines Listeneintrags über die Umkehrzuordnung `rev`,
+    None wenn er nicht zum Feldtyp passt.
+    """
+    m = re.match(r'^(.*)\s*\((.*)\)$', item)
+    return coerce_value(m.group(2) if m else rev.get(item, item), kind)
+
+
+def resolve_list(raw, value_map=None, kind=None):
+    """
+    Eindeutige, typgerechte Schlüssel einer Liste. Anzeigewerte werden über
+    eine einmal gebildete Umkehrzuordnung aufgelöst, unpassende verworfen.
+    """
+    rev = reverse_map(value_map)
+    keys = {}
+    for item in split_list(raw):
+        key = resolve_item(item, rev, kind)
+        if key is not None:
+            keys[key] = None
+    return list(keys)
+
+
+def quote_column(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def is_number(value):
+    return value.replace(".", "", 1).isdigit()
+
+
+def literal(value, kind=None):
+    if kind == KIND_TEXT or kind == KIND_DATE:
+        return quote_string(value)
+    if is_number(value):
+        return value
+    return quote_string(value)
+
+
+def list_literal(value, kind=None):
+    # Listenwerte sind bereits typgerecht (resolve_list)
+    return value if kind == KIND_NUMBER else literal(value, kind)
+
+
+def compile_condition(cond):
+    """
+    Eine Bedingung als QGIS-Ausdruck, None wenn sie (noch) leer ist.
+    """
+    f = quote_column(cond.field)
+    op = cond.operator
+    v1, v2 = cond.resolved()
+    if op == "ist leer":
+        return f"({f} IS NULL OR {f} = '{{}}')"
+    if op == "ist nicht leer":
+        return f"({f} IS NOT NULL AND {f} != '{{}}')"
+    if op == "enthält":
+        return f"{f} ILIKE {quote_string('%' + v1 + '%')}"
+    if op == "zwischen":
+        return f"{f} >= {quote_string(v1)} AND {f} <= {quote_string(v2)}"
+    if op == LIST_OPERATOR:
+        if not v1:
+            return None
+        lits = ", ".join(list_literal(v, cond.kind) for v in v1.split("\n"))
+        return f"{f} IN ({lits})"
+    if v1:
+        return f"{f} {op} {literal(v1, cond.kind)}"
+    return None
+
+
+def compile_group(group):
+    conds = [c for c in map(compile_condition, group.conditions) if c]
+    return "(" + " AND ".join(conds) + ")"
+
+
+def join_groups(groups, compiled):
+    parts = []
+    for i, (grp, expr) in enumerate(zip(groups, compiled)):
+        if i == 0:
+            parts.append(expr)
+        else:
+            parts.append((" AND " if grp.op == "UND" else " OR ") + expr)
+    return "".join(parts)
+
+
+class FilterCompiler:
+    """
+    Compiler mit Cache je Gruppe: bei Live-Vorschau werden nur geänderte
+    Gruppen neu übersetzt.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._cache = {}
+
+    def compile_group(self, group):
+        key = group.signature()
+        expr = self._cache.get(key)
+        if expr is None:
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+            expr = self._cache[key] = compile_group(group)
+        return expr
+
+    def compile(self, model):
+        return join_groups(model.groups, [self.compile_group(g) for g in model.groups])
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Optionale Zeitmessung für Layer-Scans und Widget-Neuaufbauten.
+Jeder Span hält Layer-ID, Providertyp, Feld, gelesene Zeilen, gefundene
+Werte und Laufzeit. Ausgabe ins QGIS-Protokoll (Reiter "QueryBuilder"),
+Export als JSON oder Chrome-Trace (chrome://tracing, Perfetto).
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LOG_TAG = "QueryBuilder"
+SETTINGS_KEY = "QueryBuilder/trace"
+
+
+class Span:
+    __slots__ = ("name", "layer_id", "provider", "field", "rows", "distinct",
+                 "start", "duration", "thread", "extra")
+
+    def __init__(self, name, layer_id=None, provider=None, field=None, **extra):
+        self.name = name
+        self.layer_id = layer_id
+        self.provider = provider
+        self.field = field
+        self.rows = None
+        self.distinct = None
+        self.start = time.time()
+        self.duration = 0.0
+        self.thread = threading.get_ident()
+        self.extra = extra
+
+    def count(self, iterable):
+        """
+        Reicht `iterable` durch und zählt dabei die gelesenen Zeilen.
+        """
+        self.rows = self.rows or 0
+        for item in iterable:
+            self.rows += 1
+            yield item
+
+    def set(self, **extra):
+        self.extra.update(extra)
+
+    def to_dict(self):
+        d = {"name": self.name, "layer_id": self.layer_id,
+             "provider": self.provider, "field": self.field,
+             "rows": self.rows, "distinct": self.distinct,
+             "start": self.start, "duration_ms": round(self.duration * 1000, 3)}
+        d.update(self.extra)
+        return d
+
+
+class _NullSpan:
+    """Platzhalter bei abgeschalteter Messung: schluckt alle Zuweisungen."""
+    def __setattr__(self, name, value):
+        pass
+
+    def count(self, iterable):
+        return iterable
+
+    def set(self, **extra):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self, max_spans=5000):
+        self.enabled = False
+        self.spans = deque(maxlen=max_spans)
+        self.log_to_qgis = True
+
+    @contextmanager
+    def span(self, name, layer=None, field=None, **extra):
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        s = Span(name, field=field, **extra)
+        if layer is not None:
+            s.layer_id = layer.id()
+            s.provider = layer.providerType()
+        t0 = time.perf_counter()
+        try:
+            yield s
+        finally:
+            s.duration = time.perf_counter() - t0
+            self.spans.append(s)
+            if self.log_to_qgis:
+                self._log(s)
+
+    def _log(self, s):
+        try:
+            from qgis.core import Qgis, QgsMessageLog
+        except ImportError:
+            return
+        parts = [f"{s.name}: {s.duration * 1000:.1f} ms"]
+        if s.field:
+            parts.append(f"Feld={s.field}")
+        if s.rows is not None:
+            parts.append(f"Zeilen={s.rows}")
+        if s.distinct is not None:
+            parts.append(f"Werte={s.distinct}")
+        if s.provider:
+            parts.append(f"Provider={s.provider}")
+        if s.layer_id:
+            parts.append(f"Layer={s.layer_id}")
+        QgsMessageLog.logMessage(", ".join(parts), LOG_TAG, Qgis.Info)
+
+    def clear(self):
+        self.spans.clear()
+
+    def summary(self):
+        """
+        Je Span-Name: Anzahl, Summe/Mittel/Max in ms, gelesene Zeilen.
+        """
+        out = {}
+        for s in list(self.spans):
+            st = out.setdefault(s.name, {"count": 0, "total_ms": 0.0,
+                                         "max_ms": 0.0, "rows": 0})
+            ms = s.duration * 1000
+            st["count"] += 1
+            st["total_ms"] += ms
+            st["max_ms"] = max(st["max_ms"], ms)
+            st["rows"] += s.rows or 0
+        for st in out.values():
+            st["avg_ms"] = st["total_ms"] / st["count"]
+        return out
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([s.to_dict() for s in list(self.spans)], f,
+                      ensure_ascii=False, indent=2)
+
+    def export_chrome_trace(self, path):
+        events = []
+        for s in list(self.spans):
+            args = s.to_dict()
+            for k in ("name", "start", "duration_ms"):
+                args.pop(k)
+            events.append({
+                "name": s.name, "cat": LOG_TAG, "ph": "X", "pid": 1,
+                "tid": s.thread, "ts": int(s.start * 1e6),
+                "dur": int(s.duration * 1e6), "args": args,
+            })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Prozessweiter Tracer, wird über den Statistik-Dialog ein-/ausgeschaltet
+tracer = Tracer()
+
+
+def traced(name, field_arg=None):
+    """
+    Dekorator für Dialog-Methoden: misst den Aufruf als Span mit dem
+    aktuellen Layer (self.layer) und optional dem Feld aus args[field_arg].
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if not tracer.enabled:
+                return fn(self, *args, **kwargs)
+            field = args[field_arg] if field_arg is not None and len(args) > field_arg else None
+            with tracer.span(name, getattr(self, "layer", None), field):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return deco
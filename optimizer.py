@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Optimierung eines FilterModel vor der Ausgabe als QGIS-Ausdruck.
+
+Die Gruppen werden wie im Ausdruck gelesen (UND bindet stärker als ODER)
+und als ODER von UND-Termen behandelt. Innerhalb eines UND-Terms werden
+doppelte und überflüssige Bedingungen entfernt, Bereichsgrenzen
+zusammengefasst und die Bedingungen so sortiert, dass günstige,
+selektive (indexfähige) Vergleiche zuerst stehen; QGIS bricht die
+Auswertung von AND nach dem ersten FALSE ab. ODER-Terme, die sich nur
+im Wert eines Gleichheitsvergleichs unterscheiden, werden zu IN
+zusammengeführt, enthaltene Terme entfallen.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .filter_model import (
+    KIND_DATE, KIND_NUMBER, LIST_OPERATOR, compile_condition, is_number,
+    list_literal, literal, quote_column, quote_string
+)
+
+# Kostenklassen: Vergleich/IN/NULL (Index) < Negation < ILIKE '%…%'
+COST = {"=": 0, "in": 0, "null": 0, "<": 0, "<=": 0, ">": 0, ">=": 0,
+        "between": 0, "!=": 1, "notnull": 1, "contains": 2, "raw": 1}
+# Annahmen ohne Statistik
+DEFAULT_SELECTIVITY = {"=": 0.05, "in": 0.05, "null": 0.1, "<": 0.3, "<=": 0.3,
+                       ">": 0.3, ">=": 0.3, "between": 0.2, "!=": 0.95,
+                       "notnull": 0.9, "contains": 0.3, "raw": 0.5}
+LOWER, UPPER = (">", ">="), ("<", "<=")
+
+
+@dataclass(frozen=True)
+class Pred:
+    field: str
+    op: str
+    values: Tuple[str, ...] = ()
+    lits: Tuple[str, ...] = ()
+    kind: Optional[str] = None
+    text: str = ""          # fertiger Ausdruck für null/notnull/contains/raw
+
+    def key(self):
+        return (self.field, self.op, self.lits, self.text)
+
+
+def preds_of(cond):
+    """
+    Bedingung -> Prädikate (leer, wenn sie nichts einschränkt).
+    """
+    text = compile_condition(cond)
+    if text is None:
+        return []
+    op, f, k = cond.operator, cond.field, cond.kind
+    v1, v2 = cond.resolved()
+    if op == "ist leer":
+        return [Pred(f, "null", kind=k, text=text)]
+    if op == "ist nicht leer":
+        return [Pred(f, "notnull", kind=k, text=text)]
+    if op == "enthält":
+        return [Pred(f, "contains", (v1,), kind=k, text=text)]
+    if op == "zwischen":
+        # wie compile_condition: Grenzen immer als Text
+        return [Pred(f, ">=", (v1,), (quote_string(v1),), k),
+                Pred(f, "<=", (v2,), (quote_string(v2),), k)]
+    if op == LIST_OPERATOR:
+        vals = tuple(v1.split("\n"))
+        return [Pred(f, "in", vals, tuple(list_literal(v, k) for v in vals), k)]
+    if op in ("=", "!=", "<", "<=", ">", ">="):
+        return [Pred(f, op, (v1,), (literal(v1, k),), k)]
+    return [Pred(f, "raw", kind=k, text=text)]
+
+
+def render(p, use_between=False):
+    col = quote_column(p.field)
+    if p.op == "in":
+        if len(p.lits) == 1:
+            return f"{col} = {p.lits[0]}"
+        return f"{col} IN ({', '.join(p.lits)})"
+    if p.op == "between":
+        lo, hi = p.lits
+        if use_between:
+            return f"{col} BETWEEN {lo} AND {hi}"
+        return f"{col} >= {lo} AND {col} <= {hi}"
+    if p.text:
+        return p.text
+    return f"{col} {p.op} {p.lits[0]}"
+
+
+def _comparable(p, value):
+    """Vergleichswert für Bereichslogik oder None (Text: keine Annahmen)."""
+    if p.kind == KIND_NUMBER or (p.kind is None and is_number(value)):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if p.kind == KIND_DATE:
+        return value
+    return None
+
+
+def _satisfies(value, p):
+    """True/False, ob `value` das Bereichsprädikat p erfüllt, None = unbekannt."""
+    a, b = _comparable(p, value), _comparable(p, p.values[0])
+    if a is None or b is None or type(a) is not type(b):
+        return None
+    return {"<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[p.op]
+
+
+def _tighter(p, q):
+    """Die engere von zwei gleichgerichteten Grenzen, None wenn unvergleichbar."""
+    a, b = _comparable(p, p.values[0]), _comparable(q, q.values[0])
+    if a is None or b is None or type(a) is not type(b):
+        return None
+    if a == b:
+        return p if p.op in ("<", ">") else q
+    if p.op in LOWER:
+        return p if a > b else q
+    return p if a < b else q
+
+
+def _differ(p, q):
+    """True nur, wenn die Werte zweier Gleichheiten sicher verschieden sind."""
+    a, b = _comparable(p, p.values[0]), _comparable(q, q.values[0])
+    if a is not None and b is not None and type(a) is type(b):
+        return a != b
+    quoted = p.lits[0].startswith("'") and q.lits[0].startswith("'")
+    return quoted and p.lits[0] != q.lits[0]
+
+
+def _same(p, q):
+    """True nur, wenn die Werte zweier Prädikate sicher gleich sind (5 und 5.0)."""
+    a, b = _comparable(p, p.values[0]), _comparable(q, q.values[0])
+    return a is not None and b is not None and type(a) is type(b) and a == b
+
+
+def simplify_and(preds):
+    """
+    Doppelte entfernen, Gleichheit vor Negation/Bereich, engste Grenzen
+    behalten, >=/<= auf demselben Feld zu einem Bereich zusammenfassen.
+    None, wenn der Term nie zutrifft (z. B. f = 'a' AND f = 'b').
+    """
+    uniq = list({p.key(): p for p in preds}.values())
+    fields = {}
+    for p in uniq:
+        fields.setdefault(p.field, []).append(p)
+
+    out = []
+    for field, ps in fields.items():
+        eqs = [p for p in ps if p.op == "=" or (p.op == "in" and len(p.values) == 1)]
+        if any(_differ(p, q) for i, p in enumerate(eqs) for q in eqs[i + 1:]):
+            return None
+        if len(eqs) == 1:
+            eq = eqs[0]
+            val = eq.values[0]
+            keep = [eq]
+            for p in ps:
+                if p is eq:
+                    continue
+                if p.op == "!=":
+                    if _differ(eq, p):
+                        continue
+                    if p.lits[0] == eq.lits[0] or _same(eq, p):
+                        return None
+                    keep.append(p)  # Gleichheit unklar (z. B. Text gegen Zahl)
+                    continue
+                if p.op == "notnull" and val not in ("", "{}"):
+                    continue
+                if p.op == "in" and (val in p.values):
+                    continue
+                ok = _satisfies(val, p) if p.op in LOWER + UPPER else None
+                if ok is False:
+                    return None
+                if ok:
+                    continue
+                keep.append(p)
+            out.extend(keep)
+            continue
+
+        lower = upper = None
+        rest = []
+        for p in ps:
+            if p.op in LOWER + UPPER:
+                cur = lower if p.op in LOWER else upper
+                best = p if cur is None else _tighter(cur, p)
+                if best is None:
+                    rest.append(p)
+                    continue
+                if p.op in LOWER:
+                    lower = best
+                else:
+                    upper = best
+            else:
+                rest.append(p)
+        if lower is not None and upper is not None and lower.op == ">=" and upper.op == "<=":
+            rest.append(Pred(field, "between", lower.values + upper.values,
+                             lower.lits + upper.lits, lower.kind))
+        else:
+            rest.extend(p for p in (lower, upper) if p is not None)
+        out.extend(rest)
+    return out
+
+
+def merge_or(terms):
+    """
+    ODER-Terme: Duplikate und Terme, die einen anderen Term vollständig
+    enthalten, entfallen; Terme, die sich nur in einem Gleichheits-/IN-
+    Vergleich auf demselben Feld unterscheiden, werden zu IN vereinigt.
+    """
+    changed = True
+    while changed:
+        changed = False
+        keys = [frozenset(p.key() for p in t) for t in terms]
+        # (A) OR (A AND B) = A
+        keep = []
+        for i, ki in enumerate(keys):
+            redundant = any(
+                kj < ki or (kj == ki and j < i) for j, kj in enumerate(keys) if j != i
+            )
+            if not redundant:
+                keep.append(terms[i])
+        if len(keep) != len(terms):
+            terms, changed = keep, True
+            continue
+
+        buckets = {}
+        for i, t in enumerate(terms):
+            for p in t:
+                if p.op in ("=", "in") and p.text == "":
+                    rest = frozenset(q.key() for q in t if q is not p)
+                    buckets.setdefault((p.field, p.kind, rest), []).append((i, p))
+        for (field, kind, _), hits in buckets.items():
+            idx = sorted({i for i, _ in hits})
+            if len(idx) < 2:
+                continue
+            lits = {}
+            for _, p in hits:
+                for v, lit in zip(p.values, p.lits):
+                    lits.setdefault(lit, v)
+            merged = Pred(field, "in", tuple(lits.values()), tuple(lits), kind)
+            first = terms[idx[0]]
+            own = hits[[i for i, _ in hits].index(idx[0])][1]
+            terms[idx[0]] = [merged if q is own else q for q in first]
+            terms = [t for i, t in enumerate(terms) if i not in idx[1:]]
+            changed = True
+            break
+    return terms
+
+
+class Selectivity:
+    """
+    Anteil der Treffer je Prädikat, aus der Feldstatistik (FieldStats)
+    oder aus Standardannahmen.
+    """
+
+    def __init__(self, stats=None):
+        self._stats = stats
+        self._counts = {}
+
+    def _text_counts(self, field):
+        if field not in self._counts:
+            st = self._stats(field) if self._stats is not None else None
+            if st is None or st.truncated or not st.rows:
+                self._counts[field] = None
+            else:
+                self._counts[field] = (st.text_counts(), st.rows, st.nulls)
+        return self._counts[field]
+
+    def __call__(self, p):
+        data = self._text_counts(p.field)
+        if data is None or p.op not in ("=", "in", "!=", "null", "notnull"):
+            return DEFAULT_SELECTIVITY.get(p.op, 0.5)
+        counts, rows, nulls = data
+        if p.op == "null":
+            return nulls / rows
+        if p.op == "notnull":
+            return 1 - nulls / rows
+        hits = sum(counts.get(v, 0) for v in p.values) / rows
+        return 1 - hits if p.op == "!=" else hits
+
+
+def optimize(model, stats=None, use_between=False, preds=preds_of):
+    """
+    Optimierter Ausdruck für `model` oder None, wenn sich das Modell nicht
+    sicher umformen lässt (dann den normalen Compiler verwenden).
+    `stats(feld)` liefert FieldStats oder None; BETWEEN nur mit
+    `use_between` (QGIS-Ausdrücke ab 3.26). `preds` zerlegt eine
+    Bedingung (siehe Optimizer).
+    """
+    terms = []
+    for i, grp in enumerate(model.groups):
+        group_preds = [p for c in grp.conditions for p in preds(c)]
+        if not group_preds:
+            return None
+        if i == 0 or grp.op != "UND":
+            terms.append(group_preds)
+        else:
+            terms[-1].extend(group_preds)
+    if not terms:
+        return None
+
+    selectivity = Selectivity(stats)
+    terms = [t for t in map(simplify_and, terms) if t is not None]
+    if not terms:
+        return None  # nie erfüllbar: unverändert ausgeben
+    terms = merge_or(terms)
+    out = []
+    for t in terms:
+        t = sorted(simplify_and(t), key=lambda p: (COST.get(p.op, 1), selectivity(p)))
+        out.append("(" + " AND ".join(render(p, use_between) for p in t) + ")")
+    return " OR ".join(out)
+
+
+class Optimizer:
+    """
+    optimize() mit Cache wie FilterCompiler: Prädikate je Bedingung
+    (Listen werden nur bei Änderung neu aufgelöst) und fertige Ausdrücke
+    je Modell-Signatur für die Live-Vorschau.
+    """
+
+    def __init__(self, max_entries=1024, max_results=32):
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self._preds = {}
+        self._results = {}
+
+    def preds(self, cond):
+        key = cond.signature()
+        preds = self._preds.get(key)
+        if preds is None:
+            if len(self._preds) >= self.max_entries:
+                self._preds.clear()
+            preds = self._preds[key] = preds_of(cond)
+        return preds
+
+    def optimize(self, model, stats=None, use_between=False, generation=None):
+        """
+        Wie optimize(); `generation` ändert sich, wenn neue Statistik
+        vorliegt (nur die Reihenfolge hängt davon ab).
+        """
+        key = (tuple((g.op, g.signature()) for g in model.groups), use_between, generation)
+        if key not in self._results:
+            if len(self._results) >= self.max_results:
+                self._results.clear()
+            self._results[key] = optimize(model, stats, use_between, self.preds)
+        return self._results[key]
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Processing-Provider des QueryBuilders: gespeicherte Filter-JSONs ohne
+Dialog anwenden, z. B. in Modellen oder per `qgis_process`.
+"""
+import json
+
+from qgis.core import (
+    Qgis, QgsFeatureRequest, QgsFeatureSink, QgsProcessing, QgsProcessingAlgorithm,
+    QgsProcessingException, QgsProcessingOutputNumber,
+    QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFile, QgsProcessingProvider, QgsVectorLayer
+)
+from .filter_model import (
+    FilterModel, FilterCompiler, KIND_DATE, KIND_NUMBER, KIND_TEXT, SCOPE_LAYER,
+    needs_value_map
+)
+from .instrumentation import tracer
+from .optimizer import optimize
+from .value_source import value_relation_map
+
+BATCH_SIZE = 1000
+
+
+class QueryBuilderProvider(QgsProcessingProvider):
+
+    def id(self):
+        return "querybuilder"
+
+    def name(self):
+        return "QueryBuilder"
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(ExtractByFilterAlgorithm())
+
+
+def field_kind(field):
+    if "date" in field.typeName().lower():
+        return KIND_DATE
+    return KIND_NUMBER if field.isNumeric() else KIND_TEXT
+
+
+def editor_value_map(layer, idx, project):
+    """
+    key -> Anzeigewert aus ValueMap / ValueRelation des Layers, sonst None.
+    """
+    setup = layer.editorWidgetSetup(idx)
+    cfg = setup.config()
+    if setup.type() == "ValueMap":
+        return cfg.get("map", {})
+    if setup.type() == "ValueRelation" and project is not None:
+        rel = project.mapLayer(cfg.get("Layer"))
+        if isinstance(rel, QgsVectorLayer):
+            return value_relation_map(rel, cfg.get("Key"), cfg.get("Value"),
+                                      cfg.get("FilterExpression") or "")
+    return None
+
+
+class ExtractByFilterAlgorithm(QgsProcessingAlgorithm):
+    INPUT = "INPUT"
+    FILTER = "FILTER"
+    OUTPUT = "OUTPUT"
+    COUNT = "COUNT"
+
+    def __init__(self):
+        super().__init__()
+        self.expression = ""
+
+    def createInstance(self):
+        return ExtractByFilterAlgorithm()
+
+    def name(self):
+        return "extractbyfilter"
+
+    def displayName(self):
+        return "Objekte per Filter-JSON extrahieren"
+
+    def shortHelpString(self):
+        return ("Wendet einen mit „💾 Filter speichern“ gesicherten Filter auf "
+                "einen Layer an und schreibt die Treffer in einen neuen Layer. "
+                "Der Filter wird dem Datenprovider übergeben (bei PostGIS, "
+                "GeoPackage u. a. als SQL), geschrieben wird portionsweise.")
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, "Eingabelayer", [QgsProcessing.TypeVector]
+        ))
+        self.addParameter(QgsProcessingParameterFile(
+            self.FILTER, "Filter (JSON)", extension="json"
+        ))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT, "Gefilterte Objekte"
+        ))
+        self.addOutput(QgsProcessingOutputNumber(self.COUNT, "Anzahl Treffer"))
+
+
+    def prepareAlgorithm(self, parameters, context, feedback):
+        # Im Hauptthread: Layer-Konfiguration (ValueMap/ValueRelation) lesen
+        # und den Filter einmal übersetzen
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        path = self.parameterAsFile(parameters, self.FILTER, context)
+        try:
+            with open(path, encoding="utf-8") as f:
+                model = FilterModel.from_dict(json.load(f))
+        except (OSError, ValueError) as e:
+            raise QgsProcessingException(f"Filter konnte nicht gelesen werden: {e}")
+
+        if model.scope != SCOPE_LAYER:
+            feedback.pushInfo("Der räumliche Bereich des Filters gilt nur im Dialog; "
+                              "hier bitte die Processing-Option „Nur gewählte Objekte“ nutzen.")
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        self.prepare_model(model, source.fields(), layer, context.project())
+        self.expression = (optimize(model, use_between=Qgis.QGIS_VERSION_INT >= 32600)
+                           or FilterCompiler().compile(model))
+        if self.expression.replace("(", "").replace(")", "").strip() == "":
+            raise QgsProcessingException("Der Filter enthält keine Bedingungen.")
+        return True
+
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        expr = self.expression
+        feedback.pushInfo(f"Ausdruck: {expr}")
+
+        sink, dest_id = self.parameterAsSink(
+            parameters, self.OUTPUT, context,
+            source.fields(), source.wkbType(), source.sourceCrs()
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        # Provider übersetzen den Ausdruck nach Möglichkeit selbst in SQL
+        request = QgsFeatureRequest().setFilterExpression(expr)
+        request.setExpressionContext(self.createExpressionContext(parameters, context, source))
+        total = 100.0 / source.featureCount() if source.featureCount() > 0 else 0
+
+        n = 0
+        batch = []
+        with tracer.span("extract_by_filter") as sp:
+            for feat in sp.count(source.getFeatures(request)):
+                if feedback.isCanceled():
+                    break
+                batch.append(feat)
+                if len(batch) >= BATCH_SIZE:
+                    n += self._write(sink, batch)
+                    feedback.setProgress(n * total)
+                    batch = []
+            n += self._write(sink, batch)
+            sp.set(matches=n)
+        return {self.OUTPUT: dest_id, self.COUNT: n}
+
+
+    def _write(self, sink, batch):
+        if batch and not sink.addFeatures(batch, QgsFeatureSink.FastInsert):
+            raise QgsProcessingException(
+                f"Schreiben fehlgeschlagen: {sink.lastError()}"
+            )
+        return len(batch)
+
+
+    def prepare_model(self, model, fields, layer, project):
+        """
+        Ergänzt Werttyp und (nur falls nötig) Anzeigewert-Zuordnung je
+        Bedingung, wie es der Dialog aus seinen Widgets tut.
+        """
+        maps = {}
+        for grp in model.groups:
+            for cond in grp.conditions:
+                idx = fields.indexOf(cond.field)
+                if idx < 0:
+                    raise QgsProcessingException(f"Feld „{cond.field}“ fehlt im Eingabelayer.")
+                cond.kind = field_kind(fields.at(idx))
+                if layer is None or not (needs_value_map(cond.value1)
+                                         or needs_value_map(cond.value2)):
+                    continue
+                if cond.field not in maps:
+                    maps[cond.field] = editor_value_map(layer, idx, project)
+                cond.value_map = maps[cond.field]
@@ -1,12 +1,28 @@
 from qgis.PyQt.QtWidgets import QAction, QMessageBox
+from qgis.core import QgsApplication, QgsSettings
 from .querybuilder_dialog import QueryBuilderDialog
+from .value_cache import ValueCache
+from .disk_cache import DiskCache
+from .processing_provider import QueryBuilderProvider
+from .instrumentation import tracer, SETTINGS_KEY
 
 class QueryBuilder:
     def __init__(self, iface):
         self.iface = iface
         self.action = None
+        self.dialog = None
+        self.provider = None
+        # Werte-Cache lebt am Plugin, damit er Dialog-Neustarts überlebt;
+        # der DiskCache auch QGIS-Neustarts
+        self.cache = ValueCache(disk=DiskCache.from_settings())
+        tracer.enabled = QgsSettings().value(SETTINGS_KEY, False, type=bool)
+
+    def initProcessing(self):
+        self.provider = QueryBuilderProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
+        self.initProcessing()
         self.action = QAction("QueryBuilder", self.iface.mainWindow())
         self.action.triggered.connect(self.run)
         self.iface.addPluginToMenu("QueryBuilder", self.action)
@@ -15,11 +31,13 @@ class QueryBuilder:
     def unload(self):
         self.iface.removePluginMenu("QueryBuilder", self.action)
         self.iface.removeToolBarIcon(self.action)
+        QgsApplication.processingRegistry().removeProvider(self.provider)
+        self.cache.close()
 
     def run(self):
         layer = self.iface.activeLayer()
         if not layer:
             QMessageBox.warning(None, "QueryBuilder", "Kein aktiver Layer gefunden.")
             return
-        dialog = QueryBuilderDialog(layer)
-        dialog.show()
+        self.dialog = QueryBuilderDialog(layer, self.cache, self.iface)
+        self.dialog.show()
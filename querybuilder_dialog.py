@@ -1,23 +1,82 @@
 # -*- coding: utf-8 -*-
 import json
 import random
-import re
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton,
-    QTextEdit, QLineEdit, QWidget, QDateEdit, QFrame, QFileDialog,
+    QTextEdit, QWidget, QDateEdit, QFrame, QFileDialog,
     QMessageBox, QCompleter, QScrollArea, QToolButton, QMenu
 )
-from qgis.PyQt.QtCore import Qt, QDate
-from qgis.PyQt.QtGui import QGuiApplication
+from qgis.PyQt.QtCore import Qt, QDate, QDateTime, QStringListModel, QTimer
+from qgis.PyQt import sip
+from qgis.PyQt.QtGui import QGuiApplication, QStandardItem, QStandardItemModel
 from qgis.core import (
-    QgsProject, QgsField, QgsVectorLayer, QgsFeatureRequest,
-    QgsEditorWidgetSetup
+    Qgis, QgsApplication, QgsProject, QgsSettings, QgsVectorLayer, QgsFeatureRequest,
+    QgsEditorWidgetSetup, QgsExpression
 )
+from .value_cache import ValueCache
+from .field_index import FieldIndex
+from .value_source import (
+    can_push_down, distinct_values, explode_values, sample_values,
+    value_relation_map, value_relation_columns
+)
+from .tasks import (
+    ValueLoadTask, CountTask, PrepareLayerTask, PrefixSearchTask, SummaryTask
+)
+from .widgets import LazyLineEdit, PrefixSearchModel, TraceStatsDialog, ValueListButton
+from .batch_apply import BatchApplyDialog
+from .scope import SCOPE_LABELS, scope_for
+from .instrumentation import traced
+from .optimizer import Optimizer
+from .sql_translate import dialect_for, translate, and_subset
+from .field_stats import STATS_KEY
+from .filter_model import (
+    OPERATORS, LIST_OPERATOR, Condition, Group, FilterModel, FilterCompiler,
+    needs_value_map, SCOPE_EXTENT, SCOPE_SELECTION
+)
+
+
+# Vorschläge für Zahlenfelder (Quantil -> Beschriftung)
+QUANTILES = {0.1: "P10", 0.25: "P25", 0.5: "Median", 0.75: "P75", 0.9: "P90"}
+
+
+def as_qdate(value):
+    if isinstance(value, QDateTime):
+        return value.date()
+    if isinstance(value, QDate):
+        return value
+    if isinstance(value, str):
+        return QDate.fromString(value[:10], "yyyy-MM-dd")
+    return QDate()
 
 
 class QueryBuilderDialog(QDialog):
-    def __init__(self, layer):
+    def __init__(self, layer, cache=None, iface=None):
         super().__init__()
+        # Kartenfenster für die räumliche Einschränkung (ohne iface: gesamter Layer)
+        self.canvas = iface.mapCanvas() if iface is not None else None
+        # Werte-Cache des Plugins, überlebt Schließen/Öffnen des Dialogs
+        self.cache = cache if cache is not None else ValueCache()
+        self.compiler = FilterCompiler()
+        self.optimizer = Optimizer()
+        self.stats_generation = 0   # erhöht, sobald neue Feldstatistik vorliegt
+        # Live-Vorschau, entprellt
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(300)
+        self.preview_timer.timeout.connect(self.generate_expression)
+        # Trefferzählung, entprellt und im Hintergrund
+        self.count_timer = QTimer(self)
+        self.count_timer.setSingleShot(True)
+        self.count_timer.setInterval(600)
+        self.count_timer.timeout.connect(self.update_match_count)
+        self.count_task = None
+        self.counted = None
+        # Statistik-Scan aller Felder (siehe prepare_layer)
+        self.prepare_task = None
+        # Wertebereich je Feld: Feldname -> (SummaryTask, [Callbacks])
+        self.summary_tasks = {}
+        # während set_model: keine Vorschau / Warnung je Zeile
+        self.bulk_loading = False
 
         # 80 % der Bildschirmgröße, Min/Max-Buttons erlauben
         screen = QGuiApplication.primaryScreen().availableGeometry()
@@ -41,18 +100,35 @@ class QueryBuilderDialog(QDialog):
         if idx != -1:
             self.layer_combo.setCurrentIndex(idx)
         hl.addWidget(self.layer_combo)
+        self.scope_combo = QComboBox()
+        for mode, label in SCOPE_LABELS:
+            self.scope_combo.addItem(label, mode)
+        self.scope_combo.setEnabled(self.canvas is not None)
+        hl.addWidget(QLabel("Bereich:")); hl.addWidget(self.scope_combo)
         self.layout.addLayout(hl)
         self.layer_combo.currentIndexChanged.connect(self.on_layer_change)
+        self.scope_combo.currentIndexChanged.connect(self.on_scope_change)
+        if self.canvas is not None:
+            self.canvas.extentsChanged.connect(self.on_extent_change)
+            self.canvas.selectionChanged.connect(self.on_selection_change)
+            self.canvas.currentLayerChanged.connect(self.on_selection_change)
+        self._scope = None          # (Scope oder None,) bis zur nächsten Änderung
         self.layer = layer
+        self.field_index = FieldIndex.for_layer(layer)
 
         # Buttons Save/Load
         hl2 = QHBoxLayout()
         btn_save = QPushButton("💾 Filter speichern")
         btn_load = QPushButton("📂 Filter laden")
-        hl2.addWidget(btn_save); hl2.addWidget(btn_load); hl2.addStretch()
+        btn_stats = QPushButton("📊 Statistik")
+        btn_batch = QPushButton("🗂 Auf mehrere Layer anwenden")
+        hl2.addWidget(btn_save); hl2.addWidget(btn_load); hl2.addWidget(btn_batch)
+        hl2.addStretch(); hl2.addWidget(btn_stats)
         self.layout.addLayout(hl2)
         btn_save.clicked.connect(self.save_filter)
         btn_load.clicked.connect(self.load_filter)
+        btn_batch.clicked.connect(lambda: BatchApplyDialog(self).exec_())
+        btn_stats.clicked.connect(lambda: TraceStatsDialog(self).exec_())
 
         # ScrollArea für Gruppen
         scroll = QScrollArea()
@@ -76,7 +152,12 @@ class QueryBuilderDialog(QDialog):
         # Ausdrucksvorschau
         self.preview = QTextEdit()
         self.preview.setReadOnly(True)
-        self.layout.addWidget(QLabel("Erzeugter Ausdruck:"))
+        hl_prev = QHBoxLayout()
+        hl_prev.addWidget(QLabel("Erzeugter Ausdruck:")); hl_prev.addStretch()
+        self.count_label = QLabel()
+        self.count_label.setStyleSheet("color: #888888;")
+        hl_prev.addWidget(self.count_label)
+        self.layout.addLayout(hl_prev)
         self.layout.addWidget(self.preview)
 
         # Aktion-Buttons
@@ -84,11 +165,19 @@ class QueryBuilderDialog(QDialog):
         btn_gen   = QPushButton("Ausdruck erzeugen")
         btn_copy  = QPushButton("📋 Kopieren")
         btn_apply = QPushButton("Filter anwenden (Objekte markieren)")
+        btn_subset = QPushButton("Filter anwenden (Subset, Datenbank)")
+        self.btn_restore = QPushButton("↺ Subset zurücksetzen")
+        self.btn_restore.setEnabled(False)
         hl3.addWidget(btn_gen); hl3.addWidget(btn_copy); hl3.addWidget(btn_apply)
+        hl3.addWidget(btn_subset); hl3.addWidget(self.btn_restore)
         self.layout.addLayout(hl3)
-        btn_gen.clicked.connect(self.generate_expression)
+        btn_gen.clicked.connect(lambda: self.generate_expression())
         btn_copy.clicked.connect(self.copy_expression)
-        btn_apply.clicked.connect(self.apply_filter)
+        btn_apply.clicked.connect(lambda: self.apply_filter())
+        btn_subset.clicked.connect(lambda: self.apply_subset())
+        self.btn_restore.clicked.connect(self.restore_subset)
+        # Layer-ID -> Subset vor dem ersten apply_subset
+        self.subset_backup = {}
 
         # Fußhinweis
         foot = QLabel("Hinweis: Bitte überprüfe den erzeugten Ausdruck auf Richtigkeit.")
@@ -100,103 +189,543 @@ class QueryBuilderDialog(QDialog):
         self.groups = []
         self.add_group()
         btn_grp = QPushButton("+ Gruppe hinzufügen")
-        btn_grp.clicked.connect(self.add_group)
+        btn_grp.clicked.connect(lambda: self.add_group())
         self.layout.insertWidget(self.layout.indexOf(self.warn) + 1, btn_grp)
 
         self.update_warning()
+        self.prepare_layer()
 
 
     def on_layer_change(self, idx):
         self.layer = QgsProject.instance().mapLayer(self.layer_combo.currentData())
+        self.field_index = FieldIndex.for_layer(self.layer)
+        self.btn_restore.setEnabled(self.layer.id() in self.subset_backup)
+        self._scope = None
         self.reset_ui()
+        self.prepare_layer()
+
+
+    def current_scope(self):
+        """
+        Räumliche Einschränkung für den aktuellen Layer oder None. Wird nur
+        nach Änderung von Bereich, Kartenausschnitt, Auswahl oder Layer neu
+        berechnet (Vereinigung der Auswahl ist teuer).
+        """
+        if self._scope is None:
+            self._scope = (scope_for(self.scope_combo.currentData(), self.layer, self.canvas),)
+        return self._scope[0]
+
+
+    def cache_key(self, field_name, kind=None, scope=None):
+        """
+        Cache-Schlüssel für Werte eines Feldes; mit Scope zusätzlich
+        dessen Token (Werte gelten dann nur für diesen Bereich).
+        """
+        if scope is None:
+            return field_name if kind is None else (field_name, kind)
+        return (field_name, kind or "values", scope.token())
+
+
+    def on_scope_change(self, *args):
+        # Wertelisten beim nächsten Fokus neu laden, Zählung aktualisieren
+        self._scope = None
+        for grp in self.groups:
+            for blk in grp["blocks"]:
+                self.cancel_value_task(blk)
+                for key in ("in1", "in2"):
+                    le = blk[key]
+                    if getattr(le, "_value_model", None) is not None:
+                        le._value_model.setStringList([])
+                        le.set_loader(le._load_values)
+        self.count_timer.start()
+
+
+    def on_extent_change(self):
+        if sip.isdeleted(self):
+            return
+        if self.scope_combo.currentData() == SCOPE_EXTENT:
+            self.on_scope_change()
+
+
+    def on_selection_change(self, *args):
+        if sip.isdeleted(self):
+            return
+        if self.scope_combo.currentData() == SCOPE_SELECTION:
+            self.on_scope_change()
+
+
+    def prepare_layer(self):
+        """
+        Sammelt im Hintergrund in einem einzigen Durchlauf die Statistik
+        aller Felder (ein Cache-Eintrag je Layer, STATS_KEY). Danach stehen
+        eindeutige Werte und Häufigkeiten ohne weiteren Scan bereit.
+        """
+        self.cancel_prepare_task()
+        layer = self.layer
+        if self.cache.get(layer, STATS_KEY, disk=False) is not None:
+            return
+        names = [info.name for info in self.field_index.fields]
+        task = PrepareLayerTask(layer, names, disk=self.cache.disk)
+        self.prepare_task = task
+
+        def on_done():
+            if self.prepare_task is task:
+                self.prepare_task = None
+            # jede Änderung an einem der Felder verwirft den Eintrag; auf der
+            # Platte liegt er schon (der Task hat ihn gelesen bzw. geschrieben)
+            self.cache.put(layer, STATS_KEY, task.stats, fields=set(task.stats),
+                           persist=False)
+            self.stats_generation += 1
+            if layer is self.layer and not sip.isdeleted(self):
+                self.update_date_ranges()
+
+        def on_failed():
+            if self.prepare_task is task:
+                self.prepare_task = None
+
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+        QgsApplication.taskManager().addTask(task)
+
+
+    def cancel_prepare_task(self):
+        task, self.prepare_task = self.prepare_task, None
+        if task is not None:
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
 
 
     def reset_ui(self):
-        while self.groups:
-            grp = self.groups.pop()
-            grp["frame"].deleteLater()
+        self.cancel_count_task()
+        self.cancel_summary_tasks()
+        self.counted = None
+        self.count_label.clear()
+        self.clear_groups()
         self.preview.clear()
         self.add_group()
         self.update_warning()
 
 
-    def create_input_widget(self, is_date, field_name=None):
+    def clear_groups(self):
+        while self.groups:
+            grp = self.groups.pop()
+            for blk in grp["blocks"]:
+                self.cancel_value_task(blk)
+            grp["frame"].deleteLater()
+
+
+    @traced("create_input_widget", field_arg=1)
+    def create_input_widget(self, is_date, field_name=None, blk=None):
         """
         Erzeugt QDateEdit oder QLineEdit mit Auto-Completer für
         ValueMap / ValueRelation / Fallback auf Layer-Werte.
+        Teure Completer-Daten werden erst beim ersten Fokus geladen.
         """
         if is_date:
             dt = QDateEdit(); dt.setCalendarPopup(True)
             dt.setDisplayFormat("yyyy-MM-dd")
             dt.setDate(QDate.currentDate())
+            dt._field_name = field_name
+            # vom Nutzer oder aus einem Filter gesetzte Daten nicht abschneiden
+            dt._pinned = False
+            dt.dateChanged.connect(lambda *_, dt=dt: setattr(dt, "_pinned", True))
+            # Kalender auf den Datenbereich begrenzen (Provider-Aggregat
+            # oder Layer-Statistik, siehe set_date_range)
+            if field_name:
+                self.set_date_range(dt)
             return dt
 
-        le = QLineEdit()
-        if field_name:
-            idx = self.layer.fields().indexOf(field_name)
-            setup = self.layer.editorWidgetSetup(idx)
-            wtype = setup.type()  # String: "ValueMap", "ValueRelation", ...
+        le = LazyLineEdit()
+        info = self.field_index.info(field_name) if field_name else None
+        if info is not None:
+            wtype = info.editor_type  # String: "ValueMap", "ValueRelation", ...
 
             # ValueMap
             if wtype == "ValueMap":
-                cfg = setup.config()
+                cfg = info.editor_config
                 disp_map = cfg.get("map", {})
                 choices = [f"{disp} ({key})" for key, disp in disp_map.items()]
-                comp = QCompleter(sorted(choices), self)
-                comp.setCaseSensitivity(Qt.CaseInsensitive)
-                comp.setCompletionMode(QCompleter.PopupCompletion)
-                comp.activated[str].connect(lambda txt, le=le: le.setText(txt))
-                le.setCompleter(comp)
+                self._set_completer(le, sorted(choices))
                 le._value_map = disp_map
                 return le
 
-            # ValueRelation
+            # ValueRelation (Bezugslayer wird erst bei Bedarf gelesen)
             if wtype == "ValueRelation":
-                cfg = setup.config()
-                rel_layer = QgsProject.instance().mapLayer(cfg.get("Layer"))
-                keycol, valcol = cfg.get("Key"), cfg.get("Value")
-                disp_map = {}
-                if isinstance(rel_layer, QgsVectorLayer):
-                    for f in rel_layer.getFeatures():
-                        disp_map[f[keycol]] = f[valcol]
-                choices = [f"{v} ({k})" for k, v in disp_map.items()]
-                comp = QCompleter(sorted(choices), self)
-                comp.setCaseSensitivity(Qt.CaseInsensitive)
-                comp.setCompletionMode(QCompleter.PopupCompletion)
-                comp.activated[str].connect(lambda txt, le=le: le.setText(txt))
-                le.setCompleter(comp)
-                le._value_map = disp_map
+                cfg = info.editor_config
+                le._value_map = {}
+
+                def load_relation(le, cfg=cfg):
+                    disp_map = self.value_relation_values(cfg)
+                    choices = [f"{v} ({k})" for k, v in disp_map.items()]
+                    self._set_completer(le, sorted(choices))
+                    le._value_map.update(disp_map)
+
+                le.set_loader(load_relation)
                 return le
 
-            # Fallback: eindeutige Layer-Werte
-            vals = {
-                feat[field_name]
-                for feat in self.layer.getFeatures(QgsFeatureRequest())
-                if feat[field_name] not in (None, '')
-            }
-            comp = QCompleter(sorted(str(v) for v in vals), self)
-            comp.setCaseSensitivity(Qt.CaseInsensitive)
-            comp.setCompletionMode(QCompleter.PopupCompletion)
-            comp.activated[str].connect(lambda txt, le=le: le.setText(txt))
-            le.setCompleter(comp)
+            # Zahlenfelder: Wertebereich und Quantile statt aller Werte
+            if info.is_numeric:
+                def load_summary(le, field_name=field_name):
+                    self.load_summary_async(field_name, lambda s, le=le: fill_summary(le, s))
+
+                def fill_summary(le, summary):
+                    lo, hi, quant = summary
+                    if lo is None or sip.isdeleted(le):
+                        return
+                    le.setPlaceholderText(f"{lo} … {hi}")
+                    entries = ([("Minimum", lo)]
+                               + [(QUANTILES[q], v) for q, v in sorted(quant.items())]
+                               + [("Maximum", hi)])
+                    model = QStandardItemModel(le)
+                    for label, val in entries:
+                        item = QStandardItem(f"{val}  ({label})")
+                        item.setData(str(val), Qt.UserRole)
+                        model.appendRow(item)
+                    comp = self._set_completer(le, model)
+                    comp.setCompletionRole(Qt.UserRole)
+                    comp.setModelSorting(QCompleter.UnsortedModel)
+                    if not le.text() and le.hasFocus():
+                        comp.complete()
+
+                le.set_loader(load_summary)
+                return le
+
+            # Fallback: eindeutige Layer-Werte (aus dem Cache oder im
+            # Hintergrund nachgeladen, siehe load_values_async)
+            model = QStringListModel([], le)
+            le._value_model = model
+            self._set_completer(le, model)
+
+            def load_values(le, field_name=field_name):
+                scope = self.current_scope()
+                vals = self.cached_values(field_name, scope)
+                if vals is not None and len(vals) > self.prefix_threshold():
+                    self.use_prefix_search(le, field_name)
+                elif vals is not None:
+                    le._value_model.setStringList(sorted(str(v) for v in vals))
+                elif self.has_values(field_name, scope, "partial"):
+                    self.use_prefix_search(le, field_name)
+                elif blk is not None:
+                    # Begrenzt laden: zu viele Werte => Präfix-Suche
+                    self.load_values_async(blk, field_name,
+                                           limit=self.prefix_threshold() + 1)
+                else:
+                    vals = self.distinct_values(field_name)
+                    le._value_model.setStringList(sorted(str(v) for v in vals))
+
+            le._load_values = load_values
+            le.set_loader(load_values)
 
         return le
 
 
-    def is_date_field(self, fname):
-        for f in self.layer.fields():
-            if f.name() == fname:
-                return "date" in f.typeName().lower()
-        return False
+    def prefix_threshold(self):
+        """
+        Ab dieser Anzahl eindeutiger Werte wird statt der vollständigen
+        Liste eine Präfix-Suche gegen den Layer verwendet.
+        """
+        return QgsSettings().value("QueryBuilder/prefixThreshold", 5000, type=int)
+
+
+    def use_prefix_search(self, le, field_name):
+        layer = self.layer
+        model = PrefixSearchModel(
+            lambda prefix: PrefixSearchTask(layer, field_name, prefix,
+                                            scope=self.current_scope()),
+            parent=le
+        )
+        le._value_model = None
+        model.completer = self._set_completer(le, model)
+        le.textEdited.connect(model.schedule)
+        if le.text():
+            model.schedule(le.text())
+
+
+    def _set_completer(self, le, choices):
+        comp = QCompleter(choices, self)
+        comp.setCaseSensitivity(Qt.CaseInsensitive)
+        comp.setCompletionMode(QCompleter.PopupCompletion)
+        comp.activated[str].connect(lambda txt, le=le: le.setText(txt))
+        le.setCompleter(comp)
+        return comp
+
+
+    def value_relation_values(self, cfg):
+        """
+        Key→Value-Zuordnung einer ValueRelation, geteilt über alle Zeilen
+        und Dialoge (Cache am Bezugslayer).
+        """
+        rel_layer = QgsProject.instance().mapLayer(cfg.get("Layer"))
+        if not isinstance(rel_layer, QgsVectorLayer):
+            return {}
+        keycol, valcol = cfg.get("Key"), cfg.get("Value")
+        filt = cfg.get("FilterExpression") or ""
+        key = ("ValueRelation", keycol, valcol, filt)
+        disp_map = self.cache.get(rel_layer, key)
+        if disp_map is None:
+            disp_map = self.cache.put(
+                rel_layer, key, value_relation_map(rel_layer, keycol, valcol, filt),
+                fields=value_relation_columns(keycol, valcol, filt)
+            )
+        return disp_map
+
+
+    def field_summary(self, field_name, quantiles=True):
+        """
+        (Minimum, Maximum, {q: Wert}) eines Zahl-/Datumsfeldes aus dem Cache
+        oder der Layer-Statistik, sonst None. Greift nie auf den Layer zu.
+        """
+        key = (field_name, "summary" if quantiles else "range")
+        summary = self.cache.get(self.layer, key)
+        if summary is not None:
+            return summary
+        st = self.field_stats(field_name)
+        if st is None or (quantiles and st.truncated):
+            return None
+        quant = st.quantiles(QUANTILES) if quantiles else {}
+        return self.cache.put(self.layer, key, (st.minimum, st.maximum, quant))
+
+
+    def load_summary_async(self, field_name, callback, quantiles=True):
+        """
+        Ruft `callback(summary)` auf: sofort, wenn field_summary etwas
+        liefert, sonst nach einem SummaryTask im Hintergrund. Ohne
+        `quantiles` genügt dem Task das Min/Max-Aggregat des Providers.
+        """
+        summary = self.field_summary(field_name, quantiles)
+        if summary is not None:
+            callback(summary)
+            return
+        key = (field_name, "summary" if quantiles else "range")
+        if key in self.summary_tasks:
+            self.summary_tasks[key][1].append(callback)
+            return
+        layer = self.layer
+        task = SummaryTask(layer, field_name, QUANTILES if quantiles else ())
+        self.summary_tasks[key] = (task, [callback])
+
+        def on_done():
+            entry = self.summary_tasks.get(key)
+            if entry is None or entry[0] is not task:
+                return
+            del self.summary_tasks[key]
+            summary = self.cache.put(layer, key, task.summary)
+            for cb in entry[1]:
+                cb(summary)
+
+        def on_failed():
+            if self.summary_tasks.get(key, (None,))[0] is task:
+                del self.summary_tasks[key]
+
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+        QgsApplication.taskManager().addTask(task)
+
+
+    def cancel_summary_tasks(self):
+        tasks, self.summary_tasks = self.summary_tasks, {}
+        for task, _ in tasks.values():
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
+
+
+    def set_date_range(self, dt):
+        """
+        Begrenzt den Kalender auf Min/Max des Feldes: aus Cache oder
+        Layer-Statistik, sonst per SummaryTask (Provider-Aggregat). Ohne
+        Aggregat wartet ein laufender Layer-Scan (update_date_ranges)
+        statt eines zweiten Durchlaufs. Gesetzte Daten (Eingabe, geladener
+        Filter) bleiben wählbar.
+        """
+        field_name = dt._field_name
+        if (self.field_summary(field_name, quantiles=False) is None
+                and self.prepare_task is not None
+                and not can_push_down(self.layer, field_name)):
+            return
+        self.load_summary_async(
+            field_name, lambda s, dt=dt: self._apply_date_range(dt, s), quantiles=False
+        )
+
+
+    def _apply_date_range(self, dt, summary):
+        if sip.isdeleted(dt):
+            return
+        lo, hi = as_qdate(summary[0]), as_qdate(summary[1])
+        if not (lo.isValid() and hi.isValid()):
+            return
+        if dt._pinned:
+            lo, hi = min(lo, dt.date()), max(hi, dt.date())
+        dt.setDateRange(lo, hi)
+
+
+    def update_date_ranges(self):
+        for grp in self.groups:
+            for blk in grp["blocks"]:
+                for key in ("in1", "in2"):
+                    w = blk[key]
+                    if getattr(w, "_field_name", None) and not sip.isdeleted(w):
+                        self.set_date_range(w)
 
 
-    def friendly_alias(self, f: QgsField):
-        idx = self.layer.fields().indexOf(f.name())
-        alias = self.layer.attributeAlias(idx)
-        return alias or f.name().replace("_"," ").title()
+    def field_stats(self, field_name, layer=None):
+        """
+        FieldStats des Feldes aus dem Layer-Scan (prepare_layer) oder None.
+        """
+        stats = self.cache.get(layer or self.layer, STATS_KEY, disk=False)
+        return None if stats is None else stats.get(field_name)
+
+
+    def cached_values(self, field_name, scope=None, kind=None):
+        """
+        Eindeutige Werte aus dem Cache oder (ohne Bereich) aus dem
+        Layer-Scan, sonst None. kind="partial": unvollständige Liste.
+        """
+        vals = self.cache.get(self.layer, self.cache_key(field_name, kind, scope))
+        if vals is None and scope is None:
+            st = self.field_stats(field_name)
+            if st is not None and st.truncated == (kind == "partial"):
+                vals = st.distinct()
+        return vals
 
 
-    def add_group(self):
+    def has_values(self, field_name, scope=None, kind=None):
+        """
+        Wie `cached_values(...) is not None`, ohne Werte von der Platte zu laden.
+        """
+        if self.cache.contains(self.layer, self.cache_key(field_name, kind, scope)):
+            return True
+        st = self.field_stats(field_name) if scope is None else None
+        return st is not None and st.truncated == (kind == "partial")
+
+
+    def distinct_values(self, field_name):
+        """
+        Eindeutige Werte eines Feldes (ohne NULL / ''), gecacht je Layer und Feld.
+        """
+        scope = self.current_scope()
+        key = self.cache_key(field_name, scope=scope)
+        vals = self.cached_values(field_name, scope)
+        if vals is None:
+            vals = distinct_values(self.layer, field_name, scope=scope)
+            self.cache.put(self.layer, key, vals, persist=scope is None)
+        return vals
+
+
+    def load_values_async(self, blk, field_name, callback=None, limit=-1):
+        """
+        Lädt die eindeutigen Werte einer Zeile per QgsTask und füllt die
+        Completer beider Eingaben portionsweise. `callback` wird nach dem
+        Laden aufgerufen (Werte liegen dann im Cache). Wird `limit`
+        erreicht, wechseln die Eingaben in die Präfix-Suche.
+        """
+        task = blk.get("task")
+        if task is not None and task.field_name == field_name:
+            if callback:
+                blk["callbacks"].append(callback)
+            return
+        self.cancel_value_task(blk)
+
+        layer = self.layer
+        scope = self.current_scope()
+        task = ValueLoadTask(layer, field_name, limit, scope=scope)
+        blk["task"] = task
+        blk["callbacks"] = [callback] if callback else []
+        status = blk["status"]
+        status.setText("lädt…"); status.show()
+
+        def models():
+            for key in ("in1", "in2"):
+                m = getattr(blk[key], "_value_model", None)
+                if m is not None and not sip.isdeleted(m):
+                    yield m
+
+        def on_batch(batch):
+            if blk.get("task") is not task or sip.isdeleted(status):
+                return
+            rows = [str(v) for v in batch]
+            for m in models():
+                n = m.rowCount()
+                m.insertRows(n, len(rows))
+                for i, txt in enumerate(rows):
+                    m.setData(m.index(n + i), txt)
+            status.setText(f"lädt… {len(task.values)} Werte")
+
+        def on_done():
+            if blk.get("task") is not task:
+                return
+            blk["task"] = None
+            kind = "partial" if task.truncated else None
+            self.cache.put(layer, self.cache_key(field_name, kind, scope), task.values,
+                           persist=scope is None)
+            if sip.isdeleted(status):
+                return
+            status.hide()
+            if task.truncated:
+                for key in ("in1", "in2"):
+                    if getattr(blk[key], "_value_model", None) is not None:
+                        self.use_prefix_search(blk[key], field_name)
+            for m in models():
+                m.setStringList(sorted(str(v) for v in task.values))
+            for cb in blk["callbacks"]:
+                cb()
+            blk["callbacks"] = []
+
+        def on_failed():
+            if blk.get("task") is task:
+                blk["task"] = None
+                if not sip.isdeleted(status):
+                    status.hide()
+
+        task.batchReady.connect(on_batch)
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+        QgsApplication.taskManager().addTask(task)
+
+
+    def cancel_value_task(self, blk):
+        task = blk.get("task")
+        blk["task"] = None
+        blk["callbacks"] = []
+        if task is not None:
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass  # Task bereits beendet und gelöscht
+        status = blk.get("status")
+        if status is not None and not sip.isdeleted(status):
+            status.hide()
+
+
+    def value_counts(self, field_name):
+        """
+        {Wert als Text: Anzahl} aus dem Statistik-Scan (Mehrfachwerte
+        aufgelöst), häufigste zuerst; None solange keine Statistik vorliegt.
+        """
+        # die Statistik gilt für den ganzen Layer
+        st = self.field_stats(field_name) if self.current_scope() is None else None
+        if st is None or st.truncated:
+            return None
+        counts = {}
+        for val, n in st.by_frequency():
+            txt = str(val)
+            counts[txt] = counts.get(txt, 0) + n
+        return counts
+
+
+    def is_date_field(self, fname):
+        info = self.field_index.info(fname)
+        return info is not None and info.is_date
+
+
+    def add_group(self, conditions=None):
+        """
+        Neue Gruppe; ohne `conditions` mit einer leeren Bedingung, sonst mit
+        je einer Zeile pro Condition (direkt mit Feld, Operator und Werten).
+        """
         grp = {}
         frame = QFrame(); frame.setFrameShape(QFrame.StyledPanel)
         grp["frame"] = frame
@@ -215,6 +744,7 @@ class QueryBuilderDialog(QDialog):
         hl.addStretch(); hl.addWidget(btn_dup); hl.addWidget(btn_del)
         vbox.addLayout(hl)
         op.currentTextChanged.connect(self.update_warning)
+        op.currentTextChanged.connect(self.schedule_preview)
 
         # Conditions-Box
         cond_box = QVBoxLayout(); grp["conds"] = cond_box
@@ -228,24 +758,31 @@ class QueryBuilderDialog(QDialog):
         btn_dup.clicked.connect(lambda _,g=grp: self.duplicate_group(g))
         btn_del.clicked.connect(lambda _,g=grp: self.remove_group(g))
 
-        self.add_condition(grp)
-        self.update_warning()
+        for cond in (conditions if conditions is not None else [None]):
+            self.add_condition(grp, cond)
+        if not self.bulk_loading:
+            self.update_warning()
 
 
-    def add_condition(self, group):
+    def add_condition(self, group, cond=None):
         blk = {}; hl = QHBoxLayout()
 
         fld = QComboBox()
-        for f in self.layer.fields():
-            fld.addItem(f"{self.friendly_alias(f)} ({f.name()})", f.name())
-        op = QComboBox(); op.addItems([
-            "=", "!=", ">", "<", ">=", "<=", "zwischen",
-            "enthält", "ist leer", "ist nicht leer"
-        ])
-
-        inp1 = self.create_input_widget(False, fld.currentData())
-        inp2 = self.create_input_widget(False, fld.currentData()); inp2.hide()
+        fld.setModel(self.field_index.model)
+        op = QComboBox(); op.addItems(OPERATORS)
+        # Vorgaben setzen, bevor Signale verbunden sind: Eingaben werden
+        # so nur einmal für das endgültige Feld / den Operator erzeugt
+        if cond is not None:
+            i = fld.findData(cond.field)
+            if i >= 0:
+                fld.setCurrentIndex(i)
+            op.setCurrentText(cond.operator)
+
         btn_del = QPushButton("❌"); btn_del.setToolTip("Bedingung löschen")
+        status = QLabel(); status.setStyleSheet("color: #888888;"); status.hide()
+        # Werteliste für „ist in Liste“ (ersetzt dann die Einzeleingabe)
+        lst = ValueListButton(); lst.hide()
+        lst.changed.connect(self.schedule_preview)
 
         # Werte-Popup
         btn_vals = QToolButton(); btn_vals.setText("▾"); menu = QMenu(btn_vals)
@@ -254,128 +791,297 @@ class QueryBuilderDialog(QDialog):
         btn_vals.setMenu(menu); btn_vals.setPopupMode(QToolButton.InstantPopup)
         hl.addWidget(btn_vals)
         menu.triggered.connect(lambda action, b=blk:
-            self.load_field_values(action.text(), b["fld"].currentData(), b["in1"])
+            self.load_field_values(action.text(), b["fld"].currentData(), b["in1"], b)
         )
 
-        for w in (fld,op,inp1,inp2,btn_del):
+        for w in (fld,op,lst,status,btn_del):
             hl.addWidget(w)
         container = QWidget(); container.setLayout(hl)
         group["conds"].addWidget(container)
 
-        blk.update({"fld":fld,"op":op,"in1":inp1,"in2":inp2,
-                    "del_btn":btn_del,"container":container})
+        blk.update({"fld":fld,"op":op,"in1":None,"in2":None,"kind":None,
+                    "list":lst,"del_btn":btn_del,"container":container,
+                    "status":status,"task":None,"callbacks":[]})
         group["blocks"].append(blk)
 
         def rebuild():
             name = fld.currentData(); datef = self.is_date_field(name)
             oper = op.currentText()
+            lst.setVisible(oper==LIST_OPERATOR)
+            lst.kind = self.field_kind(name)
+            # Nur der Operator hat sich geändert: Eingaben behalten
+            if blk["kind"] == (name, datef):
+                blk["in1"].setVisible(oper!=LIST_OPERATOR)
+                blk["in2"].setVisible(oper=="zwischen")
+                return
+            blk["kind"] = (name, datef)
+            self.cancel_value_task(blk)
             for w in (blk["in1"],blk["in2"]):
-                hl.removeWidget(w); w.deleteLater()
-            blk["in1"] = self.create_input_widget(datef,name)
-            blk["in2"] = self.create_input_widget(datef,name)
+                if w is not None:
+                    hl.removeWidget(w); w.deleteLater()
+            blk["in1"] = self.create_input_widget(datef,name,blk)
+            blk["in2"] = self.create_input_widget(datef,name,blk)
+            blk["in1"].setVisible(oper!=LIST_OPERATOR)
             blk["in2"].setVisible(oper=="zwischen")
+            lst.value_map_loader = lambda w=blk["in1"]: self._value_map_of(w)
+            for w in (blk["in1"],blk["in2"]):
+                sig = w.dateChanged if hasattr(w,"setDate") else w.textChanged
+                sig.connect(self.schedule_preview)
             hl.insertWidget(2,blk["in1"]); hl.insertWidget(3,blk["in2"])
             menu.triggered.disconnect()
             menu.triggered.connect(lambda action, b=blk:
-                self.load_field_values(action.text(), b["fld"].currentData(), b["in1"])
+                self.load_field_values(action.text(), b["fld"].currentData(), b["in1"], b)
             )
 
         fld.currentIndexChanged.connect(rebuild)
         op.currentTextChanged.connect(rebuild)
+        fld.currentIndexChanged.connect(self.schedule_preview)
+        op.currentTextChanged.connect(self.schedule_preview)
         rebuild()
+        if cond is not None:
+            self.set_input_values(blk, cond.value1, cond.value2)
+        self.schedule_preview()
 
         btn_del.clicked.connect(lambda: (
+            self.cancel_value_task(blk),
             group["conds"].removeWidget(container),
             container.deleteLater(),
-            group["blocks"].remove(blk)
+            group["blocks"].remove(blk),
+            self.schedule_preview()
         ))
 
 
     def duplicate_group(self, group):
-        self.add_group()
-        new = self.groups[-1]; old = group["blocks"]
-        w = new["conds"].takeAt(0).widget(); w.deleteLater()
-        new["blocks"].clear()
-        for ob in old:
-            self.add_condition(new)
-            nb = new["blocks"][-1]
-            nb["fld"].setCurrentIndex(ob["fld"].currentIndex())
-            nb["op"].setCurrentText(ob["op"].currentText())
-            for inp in ("in1","in2"):
-                raw = (ob[inp].date().toString("yyyy-MM-dd")
-                       if hasattr(ob[inp],"date") else ob[inp].text())
-                widget = nb[inp]
-                if hasattr(widget,"_value_map"):
-                    widget.setText(raw + f" ({raw})")
-                elif hasattr(widget,"setDate"):
-                    widget.setDate(QDate.fromString(raw,"yyyy-MM-dd"))
-                else:
-                    widget.setText(raw)
+        self.bulk_loading = True
+        try:
+            self.add_group([self.condition_of(blk) for blk in group["blocks"]] or None)
+        finally:
+            self.bulk_loading = False
         self.update_warning()
+        self.schedule_preview()
 
 
     def remove_group(self, group):
         if len(self.groups)<=1: return
         idx = self.groups.index(group)
+        for blk in group["blocks"]:
+            self.cancel_value_task(blk)
         group["frame"].deleteLater()
         self.groups.pop(idx)
         if idx==0:
             self.groups[0]["op"].setDisabled(True)
         self.update_warning()
+        self.schedule_preview()
 
 
     def get_val(self, w):
         return w.date().toString("yyyy-MM-dd") if hasattr(w,"date") else w.text().strip()
 
 
-    def _resolve_value_map(self, widget, raw):
-        if raw.startswith("{") and raw.endswith("}"):
-            items = re.findall(r'"([^"]+)"', raw)
-            rev = {v:k for k,v in getattr(widget,"_value_map",{}).items()}
-            keys = [rev.get(d,d) for d in items]
-            return '{' + ','.join(keys) + '}'
-        m = re.match(r'^(.*)\s*\((.*)\)$', raw)
-        if m:
-            return m.group(2)
-        rev = {v:k for k,v in getattr(widget,"_value_map",{}).items()}
-        return rev.get(raw, raw)
+    def _value_map_of(self, widget):
+        # ValueRelation-Zuordnung wird erst bei Bedarf geladen
+        if hasattr(widget, "ensure_loaded") and hasattr(widget, "_value_map"):
+            widget.ensure_loaded()
+        return getattr(widget, "_value_map", {})
+
+
+    def field_kind(self, field_name):
+        return self.field_index.kind(field_name)
+
+
+    def build_model(self):
+        """
+        Liest den aktuellen Zustand der Widgets in ein FilterModel.
+        """
+        model = FilterModel(scope=self.scope_combo.currentData())
+        for grp in self.groups:
+            g = Group(grp["op"].currentText())
+            g.conditions = [self.condition_of(blk) for blk in grp["blocks"]]
+            model.groups.append(g)
+        return model
+
+
+    def condition_of(self, blk):
+        name = blk["fld"].currentData()
+        if blk["op"].currentText() == LIST_OPERATOR:
+            v1 = blk["list"].text_value(); v2 = ""
+        else:
+            v1 = self.get_val(blk["in1"]); v2 = self.get_val(blk["in2"])
+        vm = None
+        if hasattr(blk["in1"], "_value_map"):
+            vm = (self._value_map_of(blk["in1"])
+                  if needs_value_map(v1) or needs_value_map(v2)
+                  else blk["in1"]._value_map)
+        return Condition(name, blk["op"].currentText(), v1, v2,
+                         self.field_kind(name), vm)
+
+
+    def schedule_preview(self, *args):
+        if not self.bulk_loading:
+            self.preview_timer.start()
+
+
+    def compile_model(self, model):
+        """
+        Ausdruck für `model`; optimiert (Feldstatistik aus dem Cache), außer
+        bei QueryBuilder/optimize = false oder nicht umformbaren Modellen.
+        """
+        if QgsSettings().value("QueryBuilder/optimize", True, type=bool):
+            layer = self.layer
+            expr = self.optimizer.optimize(
+                model, stats=lambda f: self.field_stats(f, layer),
+                use_between=Qgis.QGIS_VERSION_INT >= 32600,
+                generation=(layer.id(), self.stats_generation)
+            )
+            if expr is not None:
+                return expr
+        return self.compiler.compile(model)
 
 
+    @traced("generate_expression")
     def generate_expression(self):
-        parts=[]
-        for i,grp in enumerate(self.groups):
-            conds=[]
-            for blk in grp["blocks"]:
-                f=blk["fld"].currentData(); op=blk["op"].currentText()
-                d1=self.get_val(blk["in1"]); v1=self._resolve_value_map(blk["in1"],d1)
-                d2=self.get_val(blk["in2"]); v2=self._resolve_value_map(blk["in2"],d2)
-                if op=="ist leer":
-                    conds.append(f'("{f}" IS NULL OR "{f}" = \'{{}}\')')
-                elif op=="ist nicht leer":
-                    conds.append(f'("{f}" IS NOT NULL AND "{f}" != \'{{}}\')')
-                elif op=="enthält":
-                    conds.append(f'"{f}" ILIKE \'%{v1}%\'')
-                elif op=="zwischen":
-                    conds.append(f'"{f}" >= \'{v1}\' AND "{f}" <= \'{v2}\'')
-                elif v1:
-                    if v1.replace(".","",1).isdigit():
-                        conds.append(f'"{f}" {op} {v1}')
-                    else:
-                        conds.append(f'"{f}" {op} \'{v1}\'')
-            expr="(" + " AND ".join(conds) + ")"
-            if i==0:
-                parts.append(expr)
-            else:
-                conj=" AND " if grp["op"].currentText()=="UND" else " OR "
-                parts.append(conj+expr)
-        self.preview.setText("".join(parts))
+        self.preview_timer.stop()
+        self.preview.setText(self.compile_model(self.build_model()))
+        self.count_timer.start()
+
+
+    def update_match_count(self):
+        """
+        Startet die Trefferzählung für den aktuellen Ausdruck im Hintergrund.
+        """
+        expr = self.preview.toPlainText()
+        scope = self.current_scope()
+        key = (self.layer.id(), self.layer.subsetString(), expr,
+               scope.token() if scope is not None else None)
+        if key == self.counted:
+            return
+        self.cancel_count_task()
+        self.counted = key
+        if not expr or expr.replace("(", "").replace(")", "").strip() == "":
+            self.count_label.clear()
+            return
+
+        translated = self.provider_sql()
+        sql = translated[0] if translated and translated[1] else None
+
+        task = CountTask(self.layer, expr, sql, scope=scope)
+        self.count_task = task
+        self.count_label.setText("Treffer: zähle…")
+        label = self.count_label
+
+        def on_estimate(n):
+            if self.count_task is task and not sip.isdeleted(label):
+                label.setText(f"Treffer: ≈ {n:,}".replace(",", "."))
 
+        def on_done():
+            if self.count_task is task and not sip.isdeleted(label):
+                self.count_task = None
+                label.setText(f"Treffer: {task.count:,}".replace(",", "."))
 
+        def on_failed():
+            if self.count_task is task and not sip.isdeleted(label):
+                self.count_task = None
+                self.counted = None
+                label.setText("Treffer: –")
+
+        task.estimateReady.connect(on_estimate)
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+        QgsApplication.taskManager().addTask(task)
+
+
+    def cancel_count_task(self):
+        task, self.count_task = self.count_task, None
+        if task is not None:
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
+
+
+    @traced("apply_filter")
     def apply_filter(self):
         expr=self.preview.toPlainText()
-        if expr:
+        if not expr:
+            return
+        scope = self.current_scope()
+        if scope is None:
             self.layer.removeSelection()
             self.layer.selectByExpression(expr, QgsVectorLayer.SetSelection)
+            return
+        # nur Objekte im Bereich lesen (räumlicher Index des Providers)
+        req = QgsFeatureRequest().setFilterExpression(expr)
+        req.setFlags(QgsFeatureRequest.NoGeometry)
+        req.setSubsetOfAttributes(
+            list(QgsExpression(expr).referencedColumns()), self.layer.fields()
+        )
+        scope.apply(req)
+        self.layer.selectByIds([f.id() for f in self.layer.getFeatures(req)])
+
+
+    def provider_sql(self, layer=None, model=None):
+        """
+        (sql, exakt) des Filters (Standard: aktueller Filter und Layer) im
+        SQL-Dialekt des Providers, None wenn der Provider keinen bekannten
+        Dialekt hat.
+        """
+        layer = layer or self.layer
+        prov = layer.dataProvider()
+        dialect = dialect_for(prov.name(), prov.storageType())
+        if dialect is None:
+            return None
+        provider_fields = {
+            info.name for info in FieldIndex.for_layer(layer).fields
+            if info.provider_index >= 0
+        }
+        return translate(model or self.build_model(), dialect, provider_fields)
+
+
+    @traced("apply_subset")
+    def apply_subset(self):
+        """
+        Übersetzt den Filter in den SQL-Dialekt des Providers und setzt ihn
+        als subsetString, damit die Datenbank filtert (Indizes!). Nicht
+        übersetzbare Bedingungen werden anschließend per Auswahl auf der
+        eingeschränkten Menge nachgefiltert.
+        """
+        self.generate_expression()
+        layer = self.layer
+        translated = self.provider_sql()
+        if translated is None:
+            QMessageBox.information(
+                self, "QueryBuilder",
+                "Dieser Datenprovider unterstützt keine SQL-Filter –\n"
+                "der Filter wird stattdessen als Auswahl angewendet."
+            )
+            self.apply_filter()
+            return
+
+        sql, exact = translated
+        prev = self.subset_backup.get(layer.id(), layer.subsetString())
+        subset = and_subset(prev, sql)
+        if not layer.setSubsetString(subset):
+            QMessageBox.warning(
+                self, "QueryBuilder",
+                "Subset konnte nicht gesetzt werden (Layer im Bearbeitungsmodus?) –\n"
+                "der Filter wird stattdessen als Auswahl angewendet."
+            )
+            self.apply_filter()
+            return
+        self.subset_backup.setdefault(layer.id(), prev)
+        self.btn_restore.setEnabled(True)
+        layer.removeSelection()
+        # Bereich und nicht übersetzbare Bedingungen per Auswahl nachfiltern
+        if not exact or self.current_scope() is not None:
+            self.apply_filter()
+
+
+    def restore_subset(self):
+        layer = self.layer
+        if layer.id() not in self.subset_backup:
+            return
+        layer.setSubsetString(self.subset_backup.pop(layer.id()))
+        self.btn_restore.setEnabled(False)
 
 
     def copy_expression(self):
@@ -388,18 +1094,7 @@ class QueryBuilderDialog(QDialog):
         path,_ = QFileDialog.getSaveFileName(self,"Filter speichern","","JSON Files (*.json*)")
         if not path:
             return
-        data = {"version":"v0.4.3","groups":[]}
-        for grp in self.groups:
-            gd = {"op":grp["op"].currentText(),"blocks":[]}
-            for blk in grp["blocks"]:
-                bd = {
-                    "field":blk["fld"].currentData(),
-                    "operator":blk["op"].currentText(),
-                    "value1":self.get_val(blk["in1"]),
-                    "value2":self.get_val(blk["in2"])
-                }
-                gd["blocks"].append(bd)
-            data["groups"].append(gd)
+        data = self.build_model().to_dict()
         try:
             with open(path,"w",encoding="utf-8") as f:
                 json.dump(data,f,ensure_ascii=False,indent=2)
@@ -412,52 +1107,61 @@ class QueryBuilderDialog(QDialog):
         if not path:
             return
         try:
-            data = json.load(open(path,"r",encoding="utf-8"))
+            model = FilterModel.from_dict(json.load(open(path,"r",encoding="utf-8")))
         except Exception as e:
             QMessageBox.critical(self,"Fehler",f"Laden fehlgeschlagen:\n{e}")
             return
+        self.set_model(model)
 
-        # Alle Gruppen außer der ersten entfernen
-        for grp in list(self.groups)[1:]:
-            self.remove_group(grp)
-        # Erste Gruppe zurücksetzen
-        first = self.groups[0]
-        for blk in list(first["blocks"]):
-            w = blk["container"]
-            first["conds"].removeWidget(w)
-            w.deleteLater()
-            first["blocks"].remove(blk)
-
-        # Neu laden
-        for i,gd in enumerate(data.get("groups",[])):
-            if i > 0:
-                self.add_group()
-            grp = self.groups[i]
-            grp["op"].setCurrentText(gd.get("op","UND"))
-            for bd in gd.get("blocks",[]):
-                self.add_condition(grp)
-                blk = grp["blocks"][-1]
-                blk["fld"].setCurrentIndex(blk["fld"].findData(bd.get("field","")))
-                blk["op"].setCurrentText(bd.get("operator","="))
-                if hasattr(blk["in1"], "setDate"):
-                    try:
-                        d = QDate.fromString(bd.get("value1",""), "yyyy-MM-dd")
-                        blk["in1"].setDate(d)
-                    except:
-                        blk["in1"].setDate(QDate.currentDate())
-                    try:
-                        d2 = QDate.fromString(bd.get("value2",""), "yyyy-MM-dd")
-                        blk["in2"].setDate(d2)
-                    except:
-                        blk["in2"].setDate(QDate.currentDate())
-                else:
-                    blk["in1"].setText(bd.get("value1",""))
-                    blk["in2"].setText(bd.get("value2",""))
+
+    @traced("load_filter")
+    def set_model(self, model):
+        """
+        Baut die Gruppen und Bedingungen aus einem FilterModel neu auf.
+        Signale und Neuzeichnen bleiben dabei aus; Vorschau und Warnung
+        werden nur einmal am Ende aktualisiert.
+        """
+        content = self.groups_container.parentWidget()
+        content.setUpdatesEnabled(False)
+        self.bulk_loading = True
+        try:
+            i = self.scope_combo.findData(model.scope)
+            if self.canvas is not None and i >= 0:
+                self.scope_combo.blockSignals(True)
+                self.scope_combo.setCurrentIndex(i)
+                self.scope_combo.blockSignals(False)
+                self._scope = None
+            self.clear_groups()
+            for gm in (model.groups or [Group()]):
+                self.add_group(gm.conditions or None)
+                op = self.groups[-1]["op"]
+                op.blockSignals(True); op.setCurrentText(gm.op); op.blockSignals(False)
+        finally:
+            self.bulk_loading = False
+            content.setUpdatesEnabled(True)
 
         self.generate_expression()
         self.update_warning()
 
 
+    def set_input_values(self, blk, value1, value2):
+        if blk["op"].currentText() == LIST_OPERATOR:
+            blk["list"].set_text_value(value1)
+            return
+        for w, val in ((blk["in1"], value1), (blk["in2"], value2)):
+            w.blockSignals(True)
+            if hasattr(w, "setDate"):
+                d = QDate.fromString(val, "yyyy-MM-dd")
+                if d.isValid():
+                    # gespeicherte Daten außerhalb des Datenbereichs nicht abschneiden
+                    w.setDateRange(min(d, w.minimumDate()), max(d, w.maximumDate()))
+                    w._pinned = True
+                w.setDate(d if d.isValid() else QDate.currentDate())
+            else:
+                w.setText(val)
+            w.blockSignals(False)
+
+
     def update_warning(self):
         show = len(self.groups) > 1 and all(
             g["op"].currentText() == "UND" for g in self.groups[1:]
@@ -465,58 +1169,76 @@ class QueryBuilderDialog(QDialog):
         self.warn.setVisible(show)
 
 
-    def load_field_values(self, mode, field_name, le):
+    @traced("load_field_values", field_arg=1)
+    def load_field_values(self, mode, field_name, le, blk=None):
         """
         Popup mit allen / 10 Stichproben / nur verwendeten Werten.
         Berücksichtigt jetzt auch QGIS-Mehrfachwert-Strings "{a,b}".
+        Sind die Werte noch nicht im Cache, werden sie im Hintergrund
+        geladen und das Popup danach geöffnet.
+        Liegt die Layer-Statistik vor, erscheinen die Werte nach Häufigkeit
+        sortiert mit Anzahl.
         """
-        vm = getattr(le, "_value_map", None)
+        vm = self._value_map_of(le) if hasattr(le, "_value_map") else None
+        scope = self.current_scope()
+        # Stichproben brauchen keinen vollständigen Scan
+        needs_scan = mode == "Nur verwendete Werte" or (
+            vm is None and mode != "10 Stichproben"
+        )
+        if needs_scan and blk is not None and not self.has_values(field_name, scope):
+            self.load_values_async(
+                blk, field_name,
+                lambda: self.load_field_values(mode, field_name, blk["in1"], blk)
+            )
+            return
+
+        counts = self.value_counts(field_name) if mode != "10 Stichproben" else None
         if vm is not None:
             keys = list(vm.keys())
 
             if mode == "10 Stichproben":
                 keys = random.sample(keys, min(10, len(keys)))
 
+            elif mode == "Nur verwendete Werte" and counts is not None:
+                keys = sorted((k for k in keys if str(k) in counts),
+                              key=lambda k: -counts[str(k)])
+
             elif mode == "Nur verwendete Werte":
-                used = set()
-                for feat in self.layer.getFeatures(QgsFeatureRequest()):
-                    val = feat[field_name]
-                    if not val:
-                        continue
-                    if isinstance(val, (list, tuple)):
-                        for k in val:
-                            used.add(k)
-                    elif isinstance(val, str) and val.startswith("{") and val.endswith("}"):
-                        inner = val[1:-1]
-                        for part in inner.split(","):
-                            used.add(part.strip().strip("'").strip('"'))
-                    else:
-                        used.add(val)
+                used = explode_values(self.distinct_values(field_name))
                 keys = [k for k in keys if k in used]
 
             choices = [f"{vm[k]} ({k})" for k in keys]
+            if counts is not None:
+                counts = {c: counts.get(str(k), 0) for c, k in zip(choices, keys)}
+
+        elif mode == "10 Stichproben":
+            cached = self.cached_values(field_name, scope)
+            if cached is not None:
+                distinct = explode_values(cached)
+                distinct = random.sample(list(distinct), min(10, len(distinct)))
+            else:
+                distinct = sample_values(self.layer, field_name, 10, scope=scope)
+            choices = sorted(str(v) for v in distinct)
 
-        else:
-            distinct = set()
-            for feat in self.layer.getFeatures(QgsFeatureRequest()):
-                val = feat[field_name]
-                if not val:
-                    continue
-                if isinstance(val, (list, tuple)):
-                    for v in val:
-                        distinct.add(v)
-                elif isinstance(val, str) and val.startswith("{") and val.endswith("}"):
-                    inner = val[1:-1]
-                    for part in inner.split(","):
-                        distinct.add(part.strip().strip("'").strip('"'))
-                else:
-                    distinct.add(val)
+        elif counts is not None:
+            choices = list(counts)  # nach Häufigkeit
 
-            if mode == "10 Stichproben":
-                distinct = set(random.sample(list(distinct), min(10, len(distinct))))
+        else:
+            distinct = explode_values(self.distinct_values(field_name))
             choices = sorted(str(v) for v in distinct)
 
-        comp = QCompleter(choices, self)
+        if counts is not None:
+            # Anzeige "Wert (n×)", eingesetzt wird nur der Wert
+            model = QStandardItemModel(self)
+            for txt in choices:
+                item = QStandardItem(f"{txt} ({counts.get(txt, 0)}×)")
+                item.setData(txt, Qt.UserRole)
+                model.appendRow(item)
+            comp = QCompleter(model, self)
+            comp.setCompletionRole(Qt.UserRole)
+            comp.setModelSorting(QCompleter.UnsortedModel)
+        else:
+            comp = QCompleter(choices, self)
         comp.setCaseSensitivity(Qt.CaseInsensitive)
         comp.setCompletionMode(QCompleter.PopupCompletion)
         comp.activated[str].connect(lambda txt, le=le: le.setText(txt))
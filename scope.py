@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Räumliche Einschränkung von Wertelisten, Zählung und Auswahl auf den
+aktuellen Kartenausschnitt oder die ausgewählte Geometrie. Die Requests
+nutzen setFilterRect bzw. setDistanceWithin, damit der Provider seinen
+räumlichen Index verwendet.
+"""
+import hashlib
+
+from qgis.core import (
+    QgsCoordinateTransform, QgsFeatureRequest, QgsGeometry, QgsProject, QgsVectorLayer
+)
+from .filter_model import SCOPE_LAYER, SCOPE_EXTENT, SCOPE_SELECTION
+
+SCOPE_LABELS = (
+    (SCOPE_LAYER, "Gesamter Layer"),
+    (SCOPE_EXTENT, "Aktueller Kartenausschnitt"),
+    (SCOPE_SELECTION, "Ausgewählte Geometrie"),
+)
+
+
+class Scope:
+    """
+    Rechteck oder Geometrie im KBS des gefilterten Layers.
+    """
+
+    def __init__(self, mode, rect=None, geometry=None):
+        self.mode = mode
+        self.rect = rect
+        self.geometry = geometry
+
+
+    def apply(self, request):
+        if self.geometry is not None:
+            # Bounding-Box-Filter plus exakter Schnitttest, braucht Geometrien
+            request.setDistanceWithin(self.geometry, 0)
+            request.setFlags(request.flags() & ~QgsFeatureRequest.NoGeometry)
+        else:
+            request.setFilterRect(self.rect)
+        return request
+
+
+    def token(self):
+        """Kurzer Schlüssel für Caches."""
+        if self.geometry is not None:
+            return f"{self.mode}:{hashlib.md5(bytes(self.geometry.asWkb())).hexdigest()}"
+        return f"{self.mode}:{self.rect.toString(3)}"
+
+
+def scope_for(mode, layer, canvas):
+    """
+    Scope für `layer` oder None (gesamter Layer, kein Kartenfenster,
+    Layer ohne Geometrie oder keine Auswahl).
+    """
+    if mode == SCOPE_LAYER or canvas is None or not layer.isSpatial():
+        return None
+    project = QgsProject.instance()
+
+    if mode == SCOPE_EXTENT:
+        xform = QgsCoordinateTransform(
+            canvas.mapSettings().destinationCrs(), layer.crs(), project
+        )
+        return Scope(mode, rect=xform.transformBoundingBox(canvas.extent()))
+
+    # Auswahl im aktuellen Layer des Kartenfensters
+    src = canvas.currentLayer()
+    if not isinstance(src, QgsVectorLayer) or not src.selectedFeatureCount():
+        return None
+    req = QgsFeatureRequest().setNoAttributes()
+    geoms = [f.geometry() for f in src.getSelectedFeatures(req) if f.hasGeometry()]
+    if not geoms:
+        return None
+    geom = QgsGeometry.unaryUnion(geoms)
+    if src.crs() != layer.crs():
+        geom.transform(QgsCoordinateTransform(src.crs(), layer.crs(), project))
+    return Scope(mode, geometry=geom)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Übersetzung eines FilterModel in den SQL-Dialekt des Datenproviders
+(für setSubsetString). Nicht übersetzbare Bedingungen werden durch TRUE
+ersetzt; das Ergebnis ist dann eine Obermenge und muss zusätzlich mit
+dem QGIS-Ausdruck nachgefiltert werden.
+"""
+from .filter_model import (
+    KIND_NUMBER, KIND_TEXT, LIST_OPERATOR, quote_column, quote_string, literal,
+    list_literal, join_groups
+)
+
+SQL_TRUE = "1=1"
+# Höchstzahl Werte je IN-Liste (Oracle: ORA-01795 ab 1000)
+IN_CHUNK = 1000
+
+# Provider-Schlüssel (bzw. OGR-Speichertyp) -> SQL-Dialekt
+DIALECTS = {
+    "postgres": "postgres",
+    "spatialite": "sqlite",
+    "mssql": "mssql",
+    "oracle": "oracle",
+    "GPKG": "sqlite",
+    "SQLite": "sqlite",
+}
+
+
+def dialect_for(provider_key, storage_type=""):
+    if provider_key == "ogr":
+        return DIALECTS.get(storage_type)
+    return DIALECTS.get(provider_key)
+
+
+class Superset(str):
+    """
+    SQL, das mehr Zeilen liefern kann als der QGIS-Ausdruck; das Ergebnis
+    muss nachgefiltert werden (translate meldet exakt=False).
+    """
+
+
+def _contains(col, value, kind, dialect):
+    pattern = quote_string("%" + value + "%")
+    if dialect == "postgres":
+        if kind != KIND_TEXT:
+            col = f"CAST({col} AS TEXT)"
+        return f"{col} ILIKE {pattern}"
+    if dialect == "oracle":
+        return f"UPPER({col}) LIKE UPPER({pattern})"
+    if dialect == "mssql":
+        # ob LIKE Groß-/Kleinschreibung und Akzente beachtet, hängt von der
+        # Collation ab; UPPER auf beiden Seiten liefert höchstens zu viel
+        return Superset(f"UPPER({col}) LIKE UPPER({pattern})")
+    # SQLite/GPKG: LIKE ignoriert Groß-/Kleinschreibung nur bei ASCII,
+    # andere Zeichen (ä, Ü, …) passen deshalb per "_" auf jedes Zeichen
+    if value.isascii():
+        return f"{col} LIKE {pattern}"
+    loose = "".join(c if c.isascii() else "_" for c in value)
+    return Superset(f"{col} LIKE {quote_string('%' + loose + '%')}")
+
+
+def _in_list(col, values, kind):
+    if not values:
+        return ""
+    lits = [list_literal(v, kind) for v in values]
+    parts = [f"{col} IN ({', '.join(lits[i:i + IN_CHUNK])})"
+             for i in range(0, len(lits), IN_CHUNK)]
+    return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+
+def translate_condition(cond, dialect, provider_fields):
+    """
+    SQL für eine Bedingung, "" für leere Bedingungen und None, wenn sie
+    sich nicht übersetzen lässt (z. B. Join- oder virtuelle Felder).
+    """
+    if cond.field not in provider_fields:
+        return None
+    col = quote_column(cond.field)
+    op = cond.operator
+    v1, v2 = cond.resolved()
+    text = cond.kind in (None, KIND_TEXT)
+    if op == "ist leer":
+        return f"({col} IS NULL OR {col} = '{{}}')" if text else f"{col} IS NULL"
+    if op == "ist nicht leer":
+        return f"({col} IS NOT NULL AND {col} != '{{}}')" if text else f"{col} IS NOT NULL"
+    if op == "enthält":
+        return _contains(col, v1, cond.kind, dialect)
+    if op == "zwischen":
+        lo, hi = (literal(v1, cond.kind), literal(v2, cond.kind)) \
+            if cond.kind == KIND_NUMBER else (quote_string(v1), quote_string(v2))
+        return f"{col} >= {lo} AND {col} <= {hi}"
+    if op == LIST_OPERATOR:
+        return _in_list(col, v1.split("\n") if v1 else [], cond.kind)
+    if not v1:
+        return ""
+    if op not in ("=", "!=", ">", "<", ">=", "<="):
+        return None
+    return f"{col} {'<>' if op == '!=' else op} {literal(v1, cond.kind)}"
+
+
+def translate(model, dialect, provider_fields):
+    """
+    Liefert (sql, exakt). Bei exakt=False ist sql eine Obermenge des
+    Filters (nicht übersetzbare Teile = TRUE).
+    """
+    exact = True
+    compiled = []
+    for grp in model.groups:
+        conds = []
+        for cond in grp.conditions:
+            sql = translate_condition(cond, dialect, provider_fields)
+            if sql is None or isinstance(sql, Superset):
+                exact = False
+            if sql:
+                conds.append(sql)
+        compiled.append("(" + (" AND ".join(conds) or SQL_TRUE) + ")")
+    return join_groups(model.groups, compiled), exact
+
+
+def and_subset(prev, sql):
+    """
+    Verknüpft einen bestehenden Subset-String mit `sql`.
+    """
+    return f"({prev}) AND ({sql})" if prev else sql
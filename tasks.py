@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import (
+    QgsTask, QgsProviderRegistry, QgsDataProvider, QgsVectorLayerFeatureSource,
+    QgsExpression, QgsExpressionContext, QgsExpressionContextUtils,
+    QgsFeatureRequest
+)
+from .instrumentation import tracer
+from .field_stats import MAX_TOTAL_DISTINCT, STATS_KEY, scan_stats
+from .sql_translate import and_subset
+from .value_source import (
+    can_push_down, provider_field_index, value_request, iter_new_values,
+    prefix_request, reservoir_sample, sample_quantiles
+)
+
+
+def own_provider(provider_key, uri):
+    """
+    Eigener Provider je Task, der Layer-Provider ist nicht thread-sicher.
+    None, wenn er sich nicht öffnen lässt.
+    """
+    prov = QgsProviderRegistry.instance().createProvider(
+        provider_key, uri, QgsDataProvider.ProviderOptions()
+    )
+    return prov if prov is not None and prov.isValid() else None
+
+
+class ValueLoadTask(QgsTask):
+    """
+    Ermittelt eindeutige Feldwerte im Hintergrund und meldet sie
+    portionsweise über `batchReady`. Abbrechbar über cancel().
+    """
+    batchReady = pyqtSignal(list)
+
+    def __init__(self, layer, field_name, limit=-1, batch_size=500, scope=None):
+        super().__init__(f"QueryBuilder: Werte für „{field_name}“ laden",
+                         QgsTask.CanCancel)
+        self.field_name = field_name
+        self.limit = limit
+        self.batch_size = batch_size
+        self.values = set()
+        self.error = None
+
+        # Alles, was den Layer anfasst, passiert hier im GUI-Thread
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._total = max(layer.featureCount(), 1)
+        self._pushdown = (scope is None and can_push_down(layer, field_name)
+                          and not layer.isModified())
+        self._provider_key = layer.providerType()
+        self._uri = layer.source()
+        self._provider_idx = provider_field_index(layer, field_name)
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._request = value_request(layer, field_name, scope)
+
+
+    @property
+    def truncated(self):
+        """True, wenn das Limit erreicht wurde (Werteliste unvollständig)."""
+        return 0 <= self.limit <= len(self.values)
+
+
+    def run(self):
+        with tracer.span("value_task", field=self.field_name,
+                         pushdown=self._pushdown, **self._trace) as sp:
+            self._span = sp
+            try:
+                if self._pushdown and self._run_provider():
+                    return True
+                return self._run_features()
+            except Exception as e:
+                self.error = e
+                return False
+            finally:
+                sp.distinct = len(self.values)
+
+
+    def _run_provider(self):
+        prov = own_provider(self._provider_key, self._uri)
+        if prov is None:
+            return False
+        vals = [v for v in prov.uniqueValues(self._provider_idx, self.limit)
+                if v not in (None, '')]
+        self.values.update(vals)
+        for i in range(0, len(vals), self.batch_size):
+            if self.isCanceled():
+                return False
+            self.batchReady.emit(vals[i:i + self.batch_size])
+        self.setProgress(100)
+        return True
+
+
+    def _run_features(self):
+        batch = []
+        for n, val in enumerate(iter_new_values(
+                self._span.count(self._source.getFeatures(self._request)),
+                self.field_name, self.values, self.limit)):
+            if self.isCanceled():
+                return False
+            batch.append(val)
+            if len(batch) >= self.batch_size:
+                self.batchReady.emit(batch)
+                batch = []
+                self.setProgress(min(99, 100 * n / self._total))
+        if self.isCanceled():
+            return False
+        if batch:
+            self.batchReady.emit(batch)
+        return True
+
+
+class PrefixSearchTask(QgsTask):
+    """
+    Präfix-Suche für Felder mit sehr vielen Werten (siehe prefix_request).
+    Je Eingabe ein Task; der vorige wird beim nächsten Tastendruck
+    abgebrochen.
+    """
+
+    def __init__(self, layer, field_name, prefix, limit=200, scope=None):
+        super().__init__(f"QueryBuilder: „{prefix}…“ in „{field_name}“ suchen",
+                         QgsTask.CanCancel)
+        self.field_name = field_name
+        self.prefix = prefix
+        self.limit = limit
+        self.values = set()
+        self.error = None
+
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._request = prefix_request(layer, field_name, prefix, limit, scope)
+
+
+    def run(self):
+        with tracer.span("prefix_values", field=self.field_name, prefix=self.prefix,
+                         **self._trace) as sp:
+            try:
+                for _ in iter_new_values(sp.count(self._source.getFeatures(self._request)),
+                                         self.field_name, self.values, self.limit):
+                    if self.isCanceled():
+                        return False
+                return not self.isCanceled()
+            except Exception as e:
+                self.error = e
+                return False
+            finally:
+                sp.distinct = len(self.values)
+
+
+class SummaryTask(QgsTask):
+    """
+    Minimum, Maximum und Quantile eines Zahl-/Datumsfeldes im Hintergrund:
+    Min/Max als Aggregat eines eigenen Providers, wenn möglich, sonst aus
+    einem vollständigen Durchlauf; Quantile aus einer Reservoir-Stichprobe.
+    """
+
+    def __init__(self, layer, field_name, qs=(), max_rows=100000, sample=5000):
+        super().__init__(f"QueryBuilder: Wertebereich von „{field_name}“", QgsTask.CanCancel)
+        self.field_name = field_name
+        self.qs = tuple(qs)
+        self.max_rows = max_rows
+        self.sample = sample
+        self.summary = None
+        self.error = None
+
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._total = max(layer.featureCount(), 1)
+        self._pushdown = can_push_down(layer, field_name) and not layer.isModified()
+        self._provider_key = layer.providerType()
+        self._uri = layer.source()
+        self._provider_idx = provider_field_index(layer, field_name)
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._request = value_request(layer, field_name)
+
+
+    def run(self):
+        with tracer.span("summary_task", field=self.field_name,
+                         pushdown=self._pushdown, **self._trace) as sp:
+            self._span = sp
+            try:
+                bounds = self._provider_bounds() if self._pushdown else None
+                if bounds is not None and not self.qs:
+                    self.summary = bounds + ({},)
+                    return True
+                req = QgsFeatureRequest(self._request)
+                if bounds is not None:
+                    req.setLimit(self.max_rows)   # nur noch die Stichprobe
+                # ohne Aggregat: Min/Max im selben Durchlauf wie die Stichprobe
+                lo, hi, sample = self._scan(req)
+                if self.isCanceled():
+                    return False
+                if bounds is not None:
+                    lo, hi = bounds
+                self.summary = (lo, hi, sample_quantiles(sample, self.qs) if self.qs else {})
+                return True
+            except Exception as e:
+                self.error = e
+                return False
+
+
+    def _provider_bounds(self):
+        prov = own_provider(self._provider_key, self._uri)
+        if prov is None:
+            return None
+        lo = prov.minimumValue(self._provider_idx)
+        hi = prov.maximumValue(self._provider_idx)
+        return (None if lo in (None, '') else lo), (None if hi in (None, '') else hi)
+
+
+    def _scan(self, req):
+        bounds = [None, None]
+
+        def values():
+            for n, feat in enumerate(self._span.count(self._source.getFeatures(req))):
+                if n % 1000 == 0:
+                    if self.isCanceled():
+                        return
+                    self.setProgress(min(99, 100 * n / self._total))
+                val = feat[self.field_name]
+                if val in (None, ''):
+                    continue
+                try:
+                    if bounds[0] is None or val < bounds[0]:
+                        bounds[0] = val
+                    if bounds[1] is None or val > bounds[1]:
+                        bounds[1] = val
+                except TypeError:
+                    pass
+                yield val
+
+        sample = reservoir_sample(values(), self.sample if self.qs else 0)
+        return bounds[0], bounds[1], sample
+
+
+class CountTask(QgsTask):
+    """
+    Zählt die Treffer eines Filters im Hintergrund: per COUNT im Provider,
+    wenn eine exakte SQL-Übersetzung vorliegt, sonst über einen
+    geometriefreien Request mit dem Ausdruck. Bei großen Layern wird
+    vorab eine Schätzung aus einer Zufallsstichprobe gemeldet.
+    """
+    estimateReady = pyqtSignal(int)
+
+    def __init__(self, layer, expression, sql=None,
+                 sample_size=5000, estimate_above=200000, scope=None):
+        super().__init__("QueryBuilder: Treffer zählen", QgsTask.CanCancel)
+        self.expression = expression
+        self.sql = sql
+        self.sample_size = sample_size
+        self.estimate_above = estimate_above
+        self.count = None
+        self.error = None
+
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._total = layer.featureCount()
+        self._provider_key = layer.providerType()
+        self._uri = layer.source()
+        # Subset-SQL kennt keinen räumlichen Filter
+        self._pushdown = sql is not None and scope is None and not layer.isModified()
+        self._scope = scope
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._fields = layer.fields()
+        self._context = QgsExpressionContext(
+            QgsExpressionContextUtils.globalProjectLayerScopes(layer)
+        )
+
+
+    def run(self):
+        with tracer.span("count_task", pushdown=self._pushdown, **self._trace) as sp:
+            self._span = sp
+            try:
+                if self._pushdown and self._run_provider():
+                    return True
+                if self._total > self.estimate_above:
+                    self._estimate()
+                return self._run_features()
+            except Exception as e:
+                self.error = e
+                return False
+            finally:
+                sp.set(matches=self.count)
+
+
+    def _request(self):
+        expr = QgsExpression(self.expression)
+        req = QgsFeatureRequest()
+        req.setFlags(QgsFeatureRequest.NoGeometry)
+        req.setSubsetOfAttributes(list(expr.referencedColumns()), self._fields)
+        if self._scope is not None:
+            self._scope.apply(req)
+        return req, expr
+
+
+    def _run_provider(self):
+        prov = own_provider(self._provider_key, self._uri)
+        if prov is None:
+            return False
+        prev = prov.subsetString()
+        if not prov.setSubsetString(and_subset(prev, self.sql)):
+            return False
+        n = prov.featureCount()
+        if n < 0:
+            return False
+        self.count = n
+        return True
+
+
+    def _sample_ids(self):
+        """
+        (zufällige Objekt-IDs, Anzahl Objekte im Bereich) aus einem Durchlauf
+        nur über die IDs; die ersten Zeilen in Speicherreihenfolge wären bei
+        geclusterten Daten keine brauchbare Stichprobe.
+        """
+        req = QgsFeatureRequest()
+        req.setFlags(QgsFeatureRequest.NoGeometry)
+        req.setNoAttributes()
+        if self._scope is not None:
+            self._scope.apply(req)
+        seen = [0]
+
+        def ids():
+            for seen[0], feat in enumerate(self._source.getFeatures(req), 1):
+                if seen[0] % 10000 == 0 and self.isCanceled():
+                    return
+                yield feat.id()
+
+        fids = reservoir_sample(ids(), self.sample_size)
+        return fids, seen[0]
+
+
+    def _estimate(self):
+        fids, total = self._sample_ids()
+        if not fids or self.isCanceled():
+            return
+        req, expr = self._request()
+        req.setFilterFids(set(fids))
+        ctx = QgsExpressionContext(self._context)
+        expr.prepare(ctx)
+        seen = hits = 0
+        for feat in self._source.getFeatures(req):
+            if self.isCanceled():
+                return
+            ctx.setFeature(feat)
+            seen += 1
+            if expr.evaluate(ctx):
+                hits += 1
+        if seen:
+            # hochgerechnet auf die Objekte im Bereich, nicht den ganzen Layer
+            self.estimateReady.emit(int(round(hits / seen * total)))
+
+
+    def _run_features(self):
+        req, expr = self._request()
+        req.setFilterExpression(self.expression)
+        req.setExpressionContext(self._context)
+        n = 0
+        for n, _ in enumerate(self._span.count(self._source.getFeatures(req)), 1):
+            if self.isCanceled():
+                return False
+            if n % 1000 == 0:
+                self.setProgress(min(99, 100 * n / max(self._total, 1)))
+        self.count = n
+        return True
+
+
+class PrepareLayerTask(QgsTask):
+    """
+    Ein geometriefreier Durchlauf über den Layer, der für alle übergebenen
+    Felder zugleich Statistiken sammelt (Häufigkeiten, NULLs, Min/Max,
+    aufgelöste Mehrfachwerte). Gezählt werden höchstens `max_distinct`
+    Werte je Feld und `max_total` Werte über alle Felder. Mit `disk`
+    (DiskCache) wird die Statistik zuerst dort gesucht und nach einem
+    Scan dort abgelegt, beides im Task statt im GUI-Thread.
+    """
+
+    def __init__(self, layer, field_names, max_distinct=50000, max_total=MAX_TOTAL_DISTINCT,
+                 disk=None):
+        super().__init__(f"QueryBuilder: Layer „{layer.name()}“ vorbereiten",
+                         QgsTask.CanCancel)
+        self.field_names = list(field_names)
+        self.max_distinct = max_distinct
+        self.max_total = max_total
+        self.stats = None
+        self.error = None
+
+        self._disk = disk
+        self._snapshot = disk.snapshot(layer) if disk is not None else None
+
+        fields = layer.fields()
+        self._fields = [(name, fields.indexOf(name)) for name in self.field_names]
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._total = max(layer.featureCount(), 1)
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._request = QgsFeatureRequest()
+        self._request.setFlags(QgsFeatureRequest.NoGeometry)
+        self._request.setSubsetOfAttributes([idx for _, idx in self._fields])
+
+
+    def run(self):
+        with tracer.span("prepare_layer", fields=len(self._fields), **self._trace) as sp:
+            try:
+                if self._snapshot is not None:
+                    stored = self._disk.read(self._snapshot, STATS_KEY)
+                    if stored is not None and set(self.field_names) <= set(stored[0]):
+                        self.stats = stored[0]
+                        sp.set(from_disk=True)
+                        return True
+                feats = self._progress(sp.count(self._source.getFeatures(self._request)))
+                self.stats = scan_stats(feats, self._fields, self.max_distinct,
+                                        self.isCanceled, self.max_total)
+                if self.stats is None:
+                    return False
+                if self._snapshot is not None:
+                    self._disk.write(self._snapshot, STATS_KEY, self.stats, set(self.stats))
+                return True
+            except Exception as e:
+                self.error = e
+                return False
+
+
+    def _progress(self, feats):
+        for n, feat in enumerate(feats):
+            if n % 5000 == 0:
+                self.setProgress(min(99, 100 * n / self._total))
+            yield feat
+
+
+class SelectTask(QgsTask):
+    """
+    Sucht die IDs aller Treffer eines Ausdrucks im Hintergrund; markiert
+    wird danach im Hauptthread per selectByIds.
+    """
+
+    def __init__(self, layer, expression, scope=None):
+        super().__init__(f"QueryBuilder: Filter auf „{layer.name()}“", QgsTask.CanCancel)
+        self.expression = expression
+        self.ids = None
+        self.error = None
+
+        self._trace = {"layer_id": layer.id(), "provider": layer.providerType()}
+        self._total = max(layer.featureCount(), 1)
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._request = QgsFeatureRequest()
+        self._request.setFlags(QgsFeatureRequest.NoGeometry)
+        self._request.setSubsetOfAttributes(
+            list(QgsExpression(expression).referencedColumns()), layer.fields()
+        )
+        self._request.setFilterExpression(expression)
+        if scope is not None:
+            scope.apply(self._request)
+        self._request.setExpressionContext(QgsExpressionContext(
+            QgsExpressionContextUtils.globalProjectLayerScopes(layer)
+        ))
+
+
+    def run(self):
+        with tracer.span("select_task", **self._trace) as sp:
+            try:
+                ids = []
+                for n, feat in enumerate(sp.count(self._source.getFeatures(self._request))):
+                    if n % 1000 == 0:
+                        if self.isCanceled():
+                            return False
+                        self.setProgress(min(99, 100 * n / self._total))
+                    ids.append(feat.id())
+                self.ids = ids
+                sp.set(matches=len(ids))
+                return True
+            except Exception as e:
+                self.error = e
+                return False
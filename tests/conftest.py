@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Headless-Tests der Qt-freien Module. Das Plugin-Verzeichnis ist selbst das
+Paket; es wird wie in benchmarks/run_benchmarks.py über seinen Namen
+importiert.
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+PKG = os.path.basename(PLUGIN_DIR)
+
+
+def load(name):
+    return importlib.import_module(f"{PKG}.{name}")
+
+
+@pytest.fixture(scope="session")
+def fm():
+    return load("filter_model")
+
+
+@pytest.fixture(scope="session")
+def st():
+    return load("sql_translate")
+
+
+@pytest.fixture(scope="session")
+def opt():
+    return load("optimizer")
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.mark.parametrize("value, kind, expected", [
+    ("12", "number", "12"),
+    ("1 234,5", "number", "1234.5"),
+    ("-.5e3", "number", "-.5e3"),
+    ("1,234.5", "number", None),
+    ("abc", "number", None),
+    ("3.4.2021", "date", "2021-04-03"),
+    ("2021-04-03", "date", "2021-04-03"),
+    ("03/04/2021", "date", None),
+    ("irgendwas", "text", "irgendwas"),
+])
+def test_coerce_value(fm, value, kind, expected):
+    assert fm.coerce_value(value, kind) == expected
+
+
+def test_resolve_list_dedupes_and_keeps_order(fm):
+    assert fm.resolve_list("b\na;b\t c \n\n a", kind="text") == ["b", "a", "c"]
+
+
+def test_resolve_list_drops_values_of_wrong_type(fm):
+    assert fm.resolve_list("1\nzwei\n3,5\n1.0", kind="number") == ["1", "3.5", "1.0"]
+
+
+def test_resolve_list_resolves_display_values(fm):
+    vm = {1: "Eiche", 2: "Buche"}
+    raw = "Eiche\nLinde (7)\nBuche\nUnbekannt"
+    assert fm.resolve_list(raw, vm, "number") == ["1", "7", "2"]
+    assert fm.resolve_list(raw, vm, "text") == ["1", "7", "2", "Unbekannt"]
+
+
+def test_resolve_item_reports_unresolvable_entries(fm):
+    rev = fm.reverse_map({1: "Eiche"})
+    assert fm.resolve_item("Eiche", rev, "number") == "1"
+    assert fm.resolve_item("Linde (7)", rev, "number") == "7"
+    assert fm.resolve_item("Linde", rev, "number") is None
+
+
+def test_list_condition_compiles_to_single_in(fm):
+    cond = fm.Condition("art", fm.LIST_OPERATOR, "1\n2\n2\nx", kind="number")
+    assert fm.compile_condition(cond) == '"art" IN (1, 2)'
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Der optimierte Ausdruck muss dieselben Zeilen liefern wie der normale
+Compiler. Zufällige Modelle werden gegen SQLite geprüft (ILIKE als LIKE,
+daher nur ASCII-Werte).
+"""
+import itertools
+import random
+import sqlite3
+
+import pytest
+
+NUMBERS = [None, 0, 1, 2, 3, 4, 5, 6]
+NAMES = [None, "", "Eiche", "Buche", "eichel", "Linde"]
+DATES = [None, "2021-01-01", "2021-06-30", "2022-03-15"]
+# "3.0": gleicher Wert in anderer Schreibweise (5 = 5.0, aber '5' != '5.0')
+FIELDS = {"h": ("number", [str(v) for v in NUMBERS[1:]] + ["3.0"]),
+          "name": ("text", [n for n in NAMES if n]),
+          "d": ("date", DATES[1:])}
+OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "zwischen", "ist leer",
+             "ist nicht leer", "enthält"]
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (h INTEGER, name TEXT, d TEXT)")
+    db.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                   itertools.product(NUMBERS, NAMES, DATES))
+    return db
+
+
+def rows(db, expr):
+    sql = expr.replace(" ILIKE ", " LIKE ")
+    return {r[0] for r in db.execute(f"SELECT rowid FROM t WHERE {sql}")}
+
+
+def random_condition(fm, rnd):
+    field = rnd.choice(list(FIELDS))
+    kind, values = FIELDS[field]
+    op = rnd.choice(OPERATORS + [fm.LIST_OPERATOR])
+    if op == fm.LIST_OPERATOR:
+        return fm.Condition(field, op, "\n".join(rnd.sample(values, rnd.randint(1, 3))),
+                            kind=kind)
+    if op == "enthält":
+        return fm.Condition(field, op, rnd.choice(["e", "ich", "Bu", "1"]), kind=kind)
+    lo, hi = sorted(rnd.sample(values, 2))
+    return fm.Condition(field, op, rnd.choice(values) if op != "zwischen" else lo, hi,
+                        kind=kind)
+
+
+def random_model(fm, rnd):
+    return fm.FilterModel([
+        fm.Group(rnd.choice(["UND", "ODER"]),
+                 [random_condition(fm, rnd) for _ in range(rnd.randint(1, 3))])
+        for _ in range(rnd.randint(1, 3))
+    ])
+
+
+def test_in_merge_and_range(fm, opt):
+    m = fm.FilterModel([
+        fm.Group("UND", [fm.Condition("h", "=", "1", kind="number")]),
+        fm.Group("ODER", [fm.Condition("h", "=", "2", kind="number")]),
+        fm.Group("ODER", [fm.Condition("d", ">=", "2021-01-01", kind="date"),
+                          fm.Condition("d", "<=", "2021-12-31", kind="date")]),
+    ])
+    assert opt.optimize(m, use_between=True) == (
+        """("h" IN (1, 2)) OR ("d" BETWEEN '2021-01-01' AND '2021-12-31')""")
+
+
+def test_contradiction_is_not_rewritten(fm, opt):
+    m = fm.FilterModel([fm.Group("UND", [fm.Condition("h", "=", "1", kind="number"),
+                                         fm.Condition("h", "!=", "1.0", kind="number")])])
+    assert opt.optimize(m) is None
+
+
+@pytest.mark.parametrize("use_between", [False, True])
+def test_optimized_matches_compiler_on_random_models(fm, opt, db, use_between):
+    rnd = random.Random(20261018 + use_between)
+    compiler, optimizer = fm.FilterCompiler(), opt.Optimizer()
+    checked = 0
+    for _ in range(1000):
+        m = random_model(fm, rnd)
+        optimized = optimizer.optimize(m, use_between=use_between)
+        if optimized is None:
+            continue
+        plain = compiler.compile(m)
+        assert rows(db, optimized) == rows(db, plain), (plain, optimized)
+        checked += 1
+    assert checked > 500
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+NAMES = ["Müller", "MÜLLER", "mueller", "MUELLER", "Maier", None]
+
+
+def model(fm, *conds, op="UND"):
+    return fm.FilterModel([fm.Group(op, list(conds))])
+
+
+def test_translate_exact_comparisons(fm, st):
+    m = model(fm, fm.Condition("h", ">=", "5", kind="number"),
+              fm.Condition("name", "!=", "O'Neil", kind="text"))
+    assert st.translate(m, "postgres", {"h", "name"}) == (
+        """("h" >= 5 AND "name" <> 'O''Neil')""", True)
+
+
+def test_translate_unknown_field_gives_superset(fm, st):
+    m = model(fm, fm.Condition("h", "=", "5", kind="number"),
+              fm.Condition("virtuell", "=", "x", kind="text"))
+    assert st.translate(m, "sqlite", {"h"}) == ('("h" = 5)', False)
+
+
+def test_translate_list_is_chunked(fm, st):
+    raw = "\n".join(str(i) for i in range(st.IN_CHUNK + 1))
+    sql, exact = st.translate(
+        model(fm, fm.Condition("id", fm.LIST_OPERATOR, raw, kind="number")), "oracle", {"id"})
+    assert exact and sql.count(" IN (") == 2 and " OR " in sql
+
+
+@pytest.mark.parametrize("dialect", ["sqlite", "mssql"])
+def test_contains_non_ascii_is_not_exact(fm, st, dialect):
+    m = model(fm, fm.Condition("name", "enthält", "müller", kind="text"))
+    assert st.translate(m, dialect, {"name"})[1] is False
+
+
+def test_contains_ascii_is_exact_on_sqlite(fm, st):
+    m = model(fm, fm.Condition("name", "enthält", "mueller", kind="text"))
+    assert st.translate(m, "sqlite", {"name"}) == ("""("name" LIKE '%mueller%')""", True)
+
+
+@pytest.mark.parametrize("value", ["müller", "MÜLLER", "mueller", "ai"])
+def test_contains_on_sqlite_matches_qgis_ilike(fm, st, value):
+    # QGIS ILIKE: Groß-/Kleinschreibung auch bei Umlauten egal
+    expected = {n for n in NAMES if n is not None and value.lower() in n.lower()}
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (name TEXT)")
+    db.executemany("INSERT INTO t VALUES (?)", [(n,) for n in NAMES])
+    sql, exact = st.translate(
+        model(fm, fm.Condition("name", "enthält", value, kind="text")), "sqlite", {"name"})
+    got = {r[0] for r in db.execute(f"SELECT name FROM t WHERE {sql}")}
+    if exact:
+        assert got == expected
+    else:
+        assert got >= expected
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import sys
+from collections import OrderedDict
+
+
+class ValueCache:
+    """
+    Plugin-weiter LRU-Cache für eindeutige Feldwerte je (Layer-ID, Schlüssel).
+    Begrenzt über Anzahl der Einträge und grob geschätzten Speicherbedarf.
+    Einträge eines Layers werden bei Änderungen am Layer verworfen.
+    Mit `disk` (DiskCache) werden Einträge zusätzlich dauerhaft abgelegt
+    und bei einem Fehlschlag im Speicher von dort gelesen.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, disk=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries = OrderedDict()   # (layer_id, key) -> (values, size, fields)
+        self._bytes = 0
+        self._watched = {}              # layer_id -> [(signal, slot), ...]
+
+
+    def get(self, layer, key, disk=True):
+        """
+        Werte oder None; mit disk=False ohne Zugriff auf die Platte (dort
+        wird beim Fehlschlag im Speicher synchron gelesen und entpickelt).
+        """
+        entry = self._entries.get((layer.id(), key))
+        if entry is None:
+            stored = self.disk.get(layer, key) if disk and self.disk is not None else None
+            if stored is None:
+                return None
+            return self._store(layer, key, *stored)
+        self._entries.move_to_end((layer.id(), key))
+        return entry[0]
+
+
+    def put(self, layer, key, values, fields=None, persist=True):
+        """
+        `fields` sind die Felder, deren Änderung den Eintrag ungültig macht.
+        Standard: der Schlüssel selbst bzw. dessen erstes Element.
+        Mit persist=False nur im Speicher (z. B. Werte eines Kartenausschnitts).
+        """
+        if fields is None:
+            fields = {key[0] if isinstance(key, tuple) else key}
+        size = self._estimate_size(values)
+        if size > self.max_bytes:
+            # zu groß für den Cache: weder im Speicher noch auf der Platte,
+            # ein älterer Eintrag unter demselben Schlüssel wäre veraltet
+            self._pop(layer.id(), key)
+            if self.disk is not None:
+                self.disk.delete(layer, key)
+            return values
+        if persist and self.disk is not None:
+            self.disk.put(layer, key, values, fields)
+        return self._store(layer, key, values, fields, size)
+
+
+    def contains(self, layer, key):
+        """
+        True, wenn Werte im Speicher oder auf der Platte liegen; liest auf
+        der Platte nur die Metadaten.
+        """
+        if (layer.id(), key) in self._entries:
+            return True
+        return self.disk is not None and self.disk.contains(layer, key)
+
+
+    def _pop(self, layer_id, key):
+        entry = self._entries.pop((layer_id, key), None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+    def _store(self, layer, key, values, fields, size=None):
+        ck = (layer.id(), key)
+        self._pop(*ck)
+        if size is None:
+            size = self._estimate_size(values)
+        if size > self.max_bytes:
+            return values
+        self._entries[ck] = (values, size, frozenset(fields))
+        self._bytes += size
+        self._watch(layer)
+        self._evict()
+        return values
+
+
+    def invalidate(self, layer_id, field_name=None):
+        """
+        Verwirft alle Einträge eines Layers bzw. nur die, die von dem
+        angegebenen Feld abhängen.
+        """
+        for ck, (_, size, fields) in list(self._entries.items()):
+            if ck[0] != layer_id:
+                continue
+            if field_name is not None and field_name not in fields:
+                continue
+            del self._entries[ck]
+            self._bytes -= size
+
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        for lid in list(self._watched):
+            self._unwatch(lid)
+
+
+    def close(self):
+        self.clear()
+        if self.disk is not None:
+            self.disk.close()
+
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+
+    def _estimate_size(self, values):
+        if hasattr(values, "estimate_size"):
+            return values.estimate_size()
+        size = sys.getsizeof(values)
+        if isinstance(values, dict):
+            for k, v in values.items():
+                size += sys.getsizeof(k) + sys.getsizeof(v)
+        else:
+            for v in values:
+                size += sys.getsizeof(v)
+        return size
+
+
+    def _watch(self, layer):
+        lid = layer.id()
+        if lid in self._watched:
+            return
+
+        def on_attr(fid, idx, value, layer=layer):
+            self.invalidate(lid, layer.fields().at(idx).name())
+
+        def on_any(*args):
+            self.invalidate(lid)
+
+        def on_commit(*args, layer=layer):
+            # gespeicherte Änderungen: auch die Einträge auf der Platte verwerfen
+            self.invalidate(lid)
+            if self.disk is not None:
+                self.disk.invalidate(layer)
+
+        def on_deleted(*args):
+            self.invalidate(lid)
+            self._unwatch(lid)
+
+        conns = [
+            (layer.attributeValueChanged, on_attr),
+            (layer.featureAdded, on_any),
+            (layer.featureDeleted, on_any),
+            (layer.committedAttributeValuesChanges, on_commit),
+            (layer.committedFeaturesAdded, on_commit),
+            (layer.committedFeaturesRemoved, on_commit),
+            (layer.dataSourceChanged, on_any),
+            (layer.subsetStringChanged, on_any),
+            (layer.willBeDeleted, on_deleted),
+        ]
+        for sig, slot in conns:
+            sig.connect(slot)
+        self._watched[lid] = conns
+
+
+    def _unwatch(self, layer_id):
+        for sig, slot in self._watched.pop(layer_id, []):
+            try:
+                sig.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
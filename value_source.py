@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    QgsExpression, QgsExpressionContext, QgsExpressionContextUtils,
+    QgsFeatureRequest, QgsFields, QgsValueRelationFieldFormatter
+)
+from .instrumentation import tracer
+
+# Provider, deren uniqueValues() als SELECT DISTINCT in der Datenbank läuft
+PUSHDOWN_PROVIDERS = ("postgres", "ogr", "spatialite", "mssql", "oracle", "hana")
+
+
+def provider_field_index(layer, field_name):
+    """
+    Index des Feldes im Datenprovider oder -1 für Join-/virtuelle Felder.
+    """
+    fields = layer.fields()
+    idx = fields.indexOf(field_name)
+    if idx < 0 or fields.fieldOrigin(idx) != QgsFields.OriginProvider:
+        return -1
+    return fields.fieldOriginIndex(idx)
+
+
+def can_push_down(layer, field_name):
+    prov = layer.dataProvider()
+    return (
+        prov is not None
+        and prov.name() in PUSHDOWN_PROVIDERS
+        and provider_field_index(layer, field_name) >= 0
+    )
+
+
+def value_request(layer, field_name, scope=None):
+    """
+    Feature-Request nur mit dem einen Attribut und ohne Geometrie,
+    ggf. räumlich eingeschränkt (siehe scope.Scope).
+    """
+    req = QgsFeatureRequest()
+    req.setFlags(QgsFeatureRequest.NoGeometry)
+    req.setSubsetOfAttributes([field_name], layer.fields())
+    if scope is not None:
+        scope.apply(req)
+    return req
+
+
+def distinct_values(layer, field_name, limit=-1, scope=None):
+    """
+    Eindeutige Werte eines Feldes (ohne NULL / '').
+    Fragt zuerst den Datenprovider (SELECT DISTINCT), sonst wird nur die
+    eine Spalte ohne Geometrie iteriert. Mit `scope` immer über den
+    räumlich gefilterten Request.
+    """
+    pushdown = scope is None and can_push_down(layer, field_name)
+    with tracer.span("distinct_values", layer, field_name, pushdown=pushdown) as sp:
+        if pushdown:
+            # QgsVectorLayer.uniqueValues berücksichtigt auch den Edit-Puffer
+            idx = layer.fields().indexOf(field_name)
+            vals = {hashable_value(v) for v in layer.uniqueValues(idx, limit)
+                    if v not in (None, '')}
+        else:
+            vals = set()
+            feats = sp.count(layer.getFeatures(value_request(layer, field_name, scope)))
+            for _ in iter_new_values(feats, field_name, vals, limit):
+                pass
+        sp.distinct = len(vals)
+    return vals
+
+
+def hashable_value(val):
+    """
+    Listenwerte (Array-Felder) als Tupel, damit sie in Sets und Countern
+    landen können; andere nicht hashbare Werte (z. B. JSON-Objekte) als
+    JSON-Text.
+    """
+    if isinstance(val, list):
+        return tuple(hashable_value(v) for v in val)
+    try:
+        hash(val)
+    except TypeError:
+        return json.dumps(val, sort_keys=True, default=str)
+    return val
+
+
+def iter_new_values(features, field_name, seen, limit=-1):
+    """
+    Liefert jeden noch nicht gesehenen Wert genau einmal und trägt ihn in
+    `seen` ein. Bricht ab, sobald `limit` Werte gesammelt sind.
+    """
+    for feat in features:
+        val = hashable_value(feat[field_name])
+        if val in (None, '') or val in seen:
+            continue
+        seen.add(val)
+        yield val
+        if 0 <= limit <= len(seen):
+            return
+
+
+def split_multi_value(val):
+    """
+    Einzelwerte eines QGIS-Mehrfachwerts (Liste oder String "{a,b}").
+    """
+    if not val:
+        return
+    if isinstance(val, (list, tuple)):
+        yield from val
+    elif isinstance(val, str) and val.startswith("{") and val.endswith("}"):
+        for part in val[1:-1].split(","):
+            yield part.strip().strip("'").strip('"')
+    else:
+        yield val
+
+
+def explode_values(values):
+    """
+    Löst Mehrfachwerte (Listen oder Strings "{a,b}") in Einzelwerte auf.
+    """
+    out = set()
+    for val in values:
+        out.update(split_multi_value(val))
+    return out
+
+
+def sample_values(layer, field_name, k=10, pool=1000, max_rows=100000, scope=None):
+    """
+    Zufällige Stichprobe von `k` eindeutigen (Einzel-)Werten ohne
+    vollständigen Scan: beim Provider über ein begrenztes SELECT DISTINCT,
+    sonst Reservoir-Sampling über höchstens `max_rows` Zeilen bzw. bis
+    `pool` verschiedene Werte gesehen wurden. Speicherbedarf ist konstant.
+    """
+    if scope is None and can_push_down(layer, field_name):
+        candidates = list(explode_values(distinct_values(layer, field_name, pool)))
+        return random.sample(candidates, min(k, len(candidates)))
+
+    req = value_request(layer, field_name, scope)
+    req.setLimit(max_rows)
+    reservoir, seen, parts = [], set(), set()
+    with tracer.span("sample_values", layer, field_name) as sp:
+        for val in iter_new_values(sp.count(layer.getFeatures(req)), field_name, seen):
+            for part in split_multi_value(val):
+                if part in parts:
+                    continue
+                parts.add(part)
+                n = len(parts)
+                if n <= k:
+                    reservoir.append(part)
+                else:
+                    j = random.randrange(n)
+                    if j < k:
+                        reservoir[j] = part
+            if len(parts) >= pool or len(seen) >= pool:
+                break
+        sp.distinct = len(parts)
+    return reservoir
+
+
+def prefix_request(layer, field_name, prefix, limit=200, scope=None):
+    """
+    Request für höchstens `limit` eindeutige Werte, die mit `prefix`
+    beginnen (ILIKE 'abc%', vom Provider nach Möglichkeit als SQL
+    ausgeführt). Ohne ORDER BY: Provider, die den Request nicht
+    übersetzen, müssten sonst den ganzen Layer lesen und sortieren;
+    sortiert wird die kleine Treffermenge danach in Python.
+    """
+    fld = layer.fields().field(field_name)
+    col = QgsExpression.quotedColumnRef(field_name)
+    if fld.type() != QVariant.String:
+        col = f"to_string({col})"
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    req = value_request(layer, field_name, scope)
+    req.setFilterExpression(f"{col} ILIKE {QgsExpression.quotedString(pattern)}")
+    # Duplikate mit einplanen, die Zeilenzahl aber trotzdem begrenzen
+    req.setLimit(limit * 20)
+    return req
+
+
+def value_relation_columns(keycol, valcol, filter_expr=""):
+    """
+    Spalten, die eine ValueRelation-Zuordnung liest (Key, Value und die
+    Spalten des Filterausdrucks).
+    """
+    cols = {keycol, valcol}
+    if filter_expr:
+        cols |= set(QgsExpression(filter_expr).referencedColumns())
+    return cols
+
+
+def value_relation_map(rel_layer, keycol, valcol, filter_expr=""):
+    """
+    Key→Value-Zuordnung einer ValueRelation: nur die benötigten Spalten,
+    ohne Geometrie und unter Beachtung des FilterExpression. Ausdrücke,
+    die den aktuellen Formularzustand (current_value() etc.) brauchen,
+    lassen sich ohne Formular nicht auswerten und werden ignoriert.
+    """
+    req = QgsFeatureRequest()
+    req.setFlags(QgsFeatureRequest.NoGeometry)
+    if filter_expr and not (
+        QgsValueRelationFieldFormatter.expressionRequiresFormScope(filter_expr)
+        or QgsValueRelationFieldFormatter.expressionRequiresParentFormScope(filter_expr)
+    ):
+        req.setFilterExpression(filter_expr)
+        req.setExpressionContext(QgsExpressionContext(
+            QgsExpressionContextUtils.globalProjectLayerScopes(rel_layer)
+        ))
+    req.setSubsetOfAttributes(
+        list(value_relation_columns(keycol, valcol, filter_expr)), rel_layer.fields()
+    )
+    with tracer.span("value_relation_map", rel_layer, valcol, key=keycol) as sp:
+        disp_map = {f[keycol]: f[valcol] for f in sp.count(rel_layer.getFeatures(req))}
+        sp.distinct = len(disp_map)
+    return disp_map
+
+
+def reservoir_sample(values, k):
+    """
+    Gleichverteilte Stichprobe von höchstens `k` Werten aus einem Iterator
+    (konstanter Speicher).
+    """
+    reservoir = []
+    for n, val in enumerate(values, 1):
+        if len(reservoir) < k:
+            reservoir.append(val)
+        else:
+            j = random.randrange(n)
+            if j < k:
+                reservoir[j] = val
+    return reservoir
+
+
+def sample_quantiles(values, qs):
+    """
+    {q: Wert} aus einer (Stichproben-)Liste vergleichbarer Werte.
+    """
+    try:
+        vals = sorted(values)
+    except TypeError:
+        return {}
+    if not vals:
+        return {}
+    return {q: vals[int(round(q * (len(vals) - 1)))] for q in qs}
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+import csv
+
+from qgis.PyQt.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QStringListModel, QTimer, pyqtSignal
+)
+from qgis.PyQt.QtWidgets import (
+    QCheckBox, QDialog, QDialogButtonBox, QFileDialog, QHBoxLayout, QLabel,
+    QLineEdit, QMessageBox, QPlainTextEdit, QPushButton, QTableWidget,
+    QTableWidgetItem, QVBoxLayout
+)
+from qgis.PyQt import sip
+from qgis.core import QgsApplication, QgsSettings
+from .instrumentation import tracer, SETTINGS_KEY
+from .filter_model import split_list, resolve_item, reverse_map
+
+
+class LazyLineEdit(QLineEdit):
+    """
+    QLineEdit, das seine Completer-Daten erst beim ersten Fokus bzw. der
+    ersten Eingabe über den übergebenen Loader anfordert.
+    """
+
+    def __init__(self, loader=None, parent=None):
+        super().__init__(parent)
+        self._loader = loader
+        self.textEdited.connect(self.ensure_loaded)
+
+
+    def set_loader(self, loader):
+        self._loader = loader
+
+
+    def ensure_loaded(self, *args):
+        loader, self._loader = self._loader, None
+        if loader is not None:
+            loader(self)
+
+
+    def focusInEvent(self, event):
+        self.ensure_loaded()
+        super().focusInEvent(event)
+
+
+class FieldListModel(QAbstractListModel):
+    """
+    Feldliste eines Layers ("Alias (name)", UserRole = Feldname), von allen
+    Feld-Auswahlen eines Layers gemeinsam genutzt.
+    """
+
+    def __init__(self, field_index):
+        super().__init__()
+        self._index = field_index
+
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._index.fields)
+
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        info = self._index.fields[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return info.label
+        if role == Qt.UserRole:
+            return info.name
+        if role == Qt.ToolTipRole:
+            return info.type_name
+        return None
+
+
+class PrefixSearchModel(QStringListModel):
+    """
+    Completer-Modell für Felder mit sehr vielen Werten: nach jeder
+    (entprellten) Eingabe wird eine begrenzte Präfix-Suche im Hintergrund
+    ausgeführt. `search(prefix)` liefert einen QgsTask mit `.values`;
+    ein noch laufender Task wird bei neuer Eingabe abgebrochen.
+    """
+
+    def __init__(self, search, delay=250, parent=None):
+        super().__init__(parent)
+        self._search = search
+        self._pending = ""
+        self._prefix = None
+        self._task = None
+        self.completer = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._run)
+
+
+    def schedule(self, text):
+        self._pending = text
+        self._timer.start()
+
+
+    def _run(self):
+        prefix = self._pending.strip()
+        if not prefix or prefix == self._prefix:
+            return
+        self._prefix = prefix
+        self.cancel()
+        task = self._task = self._search(prefix)
+
+        def on_done():
+            if self._task is not task or sip.isdeleted(self):
+                return
+            self._task = None
+            self.setStringList(sorted(str(v) for v in task.values))
+            if self.completer is not None:
+                self.completer.complete()
+
+        def on_failed():
+            if self._task is task:
+                self._task = None
+                self._prefix = None  # gleiche Eingabe erneut suchen
+
+        task.taskCompleted.connect(on_done)
+        task.taskTerminated.connect(on_failed)
+        QgsApplication.taskManager().addTask(task)
+
+
+    def cancel(self):
+        task, self._task = self._task, None
+        if task is not None:
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
+
+
+class ValueListButton(QPushButton):
+    """
+    Eingabe für „ist in Liste“: zeigt die Anzahl der Werte und öffnet
+    den ValueListDialog zum Einfügen oder Laden aus einer Datei.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Werttyp des Feldes und Loader der Anzeigewert-Zuordnung (wird erst
+        # beim Öffnen des Editors aufgerufen), für die Prüfung im Editor
+        self.kind = None
+        self.value_map_loader = None
+        self._raw = ""
+        self.clicked.connect(self.edit)
+        self._update_text()
+
+
+    def text_value(self):
+        return self._raw
+
+
+    def set_text_value(self, raw):
+        self._raw = raw or ""
+        self._update_text()
+
+
+    def _update_text(self):
+        self.setText(f"📋 Liste ({len(split_list(self._raw))} Werte)")
+
+
+    def edit(self):
+        loader = self.value_map_loader
+        value_map = loader() if loader is not None else None
+        dlg = ValueListDialog(self._raw, self.kind, value_map, self)
+        if dlg.exec_():
+            self.set_text_value(dlg.raw())
+            self.changed.emit()
+
+
+class ValueListDialog(QDialog):
+    """
+    Werteliste bearbeiten: ein Wert je Zeile (auch Tabs oder ";" trennen),
+    Laden aus Text-/CSV-Datei (erste Spalte). Duplikate werden entfernt.
+    """
+
+    def __init__(self, raw="", kind=None, value_map=None, parent=None):
+        super().__init__(parent)
+        self.kind = kind
+        self._rev = reverse_map(value_map)
+        self.setWindowTitle("QueryBuilder – Werteliste")
+        self.resize(420, 480)
+        vbox = QVBoxLayout(self)
+        self.edit = QPlainTextEdit()
+        self.edit.setPlaceholderText("Ein Wert je Zeile, z. B. aus einer Tabelle eingefügt")
+        self.edit.setPlainText(raw)
+        vbox.addWidget(self.edit)
+        self.info = QLabel(); self.info.setStyleSheet("color: #888888;")
+        vbox.addWidget(self.info)
+
+        hl = QHBoxLayout()
+        btn_file = QPushButton("📂 Aus Datei laden…")
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        hl.addWidget(btn_file); hl.addStretch(); hl.addWidget(buttons)
+        vbox.addLayout(hl)
+        btn_file.clicked.connect(self.load_file)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(200)
+        self._timer.timeout.connect(self.update_info)
+        self.edit.textChanged.connect(self._timer.start)
+        self.update_info()
+
+
+    def raw(self):
+        return "\n".join(split_list(self.edit.toPlainText()))
+
+
+    def update_info(self):
+        values = split_list(self.edit.toPlainText())
+        bad = sum(1 for v in values if resolve_item(v, self._rev, self.kind) is None)
+        txt = f"{len(values)} eindeutige Werte"
+        if bad:
+            txt += f", {bad} passen nicht zum Feldtyp und werden ignoriert"
+        self.info.setText(txt)
+
+
+    def load_file(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Werteliste laden", "", "Text/CSV (*.txt *.csv);;Alle Dateien (*)"
+        )
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                sample = f.read(4096); f.seek(0)
+                try:
+                    dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+                except csv.Error:
+                    dialect = csv.excel_tab
+                values = [row[0] for row in csv.reader(f, dialect) if row]
+        except (OSError, UnicodeDecodeError) as e:
+            QMessageBox.critical(self, "Fehler", f"Laden fehlgeschlagen:\n{e}")
+            return
+        self.edit.setPlainText("\n".join(values))
+
+
+class TraceStatsDialog(QDialog):
+    """
+    Kleine Übersicht der gemessenen Spans mit Export (JSON / Chrome-Trace).
+    """
+    COLUMNS = ("Messpunkt", "Anzahl", "Summe ms", "Mittel ms", "Max ms", "Zeilen")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("QueryBuilder – Laufzeitstatistik")
+        self.resize(640, 360)
+        vbox = QVBoxLayout(self)
+
+        self.chk = QCheckBox("Messung aktiv (Ausgabe im Protokoll, Reiter „QueryBuilder“)")
+        self.chk.setChecked(tracer.enabled)
+        self.chk.toggled.connect(self.set_enabled)
+        vbox.addWidget(self.chk)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        vbox.addWidget(self.table)
+
+        hl = QHBoxLayout()
+        btn_refresh = QPushButton("Aktualisieren")
+        btn_json = QPushButton("Export JSON")
+        btn_chrome = QPushButton("Export Chrome-Trace")
+        btn_clear = QPushButton("Leeren")
+        for b in (btn_refresh, btn_json, btn_chrome, btn_clear):
+            hl.addWidget(b)
+        vbox.addLayout(hl)
+        btn_refresh.clicked.connect(self.refresh)
+        btn_json.clicked.connect(lambda: self.export(tracer.export_json))
+        btn_chrome.clicked.connect(lambda: self.export(tracer.export_chrome_trace))
+        btn_clear.clicked.connect(lambda: (tracer.clear(), self.refresh()))
+        self.refresh()
+
+
+    def set_enabled(self, on):
+        tracer.enabled = on
+        QgsSettings().setValue(SETTINGS_KEY, on)
+
+
+    def refresh(self):
+        stats = sorted(tracer.summary().items(), key=lambda kv: -kv[1]["total_ms"])
+        self.table.setRowCount(len(stats))
+        for row, (name, st) in enumerate(stats):
+            cells = (name, st["count"], f"{st['total_ms']:.1f}",
+                     f"{st['avg_ms']:.1f}", f"{st['max_ms']:.1f}", st["rows"])
+            for col, val in enumerate(cells):
+                self.table.setItem(row, col, QTableWidgetItem(str(val)))
+        self.table.resizeColumnsToContents()
+
+
+    def export(self, writer):
+        path, _ = QFileDialog.getSaveFileName(self, "Messung exportieren", "", "JSON Files (*.json)")
+        if path:
+            writer(path)